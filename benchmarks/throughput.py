@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import jasper
+from soundpack.manifest import BuildManifest
+from soundpack.pipeline import SynthesisPipeline
+from soundpack.soundlist import merge_soundlists
+from ttsproviders.mocktts import PROVIDER_PROFILES, MockTTS
+from ttsproviders.ratelimiter import RateLimiter
+
+try:
+	import resource
+except ImportError:
+	# Windows has no getrusage, the processing CPU time and peak memory are reported as null
+	resource = None
+
+RESULTS_DIRECTORY = f"benchmarks{os.sep}results"
+DEFAULT_SOUNDLISTS = [f"soundlists{os.sep}*.csv", f"soundlists{os.sep}*{os.sep}*.csv"]
+
+
+# Measures jasper's own overhead: every soundlist is built into a temporary sound pack with the
+# offline MockTTS provider, so neither the network nor a quota adds noise. Per soundlist it
+# records rows/sec, the latency of each row from its request to the written file, the CPU
+# time of every stage and the peak memory, and writes everything to one JSON file.
+class TimedMockTTS(MockTTS):
+	# Remembers when each phrase was requested, retries keep the time of the first attempt
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.request_times = {}
+
+	async def synthesize_async(self, text):
+		self.request_times.setdefault(text, time.perf_counter())
+		return await super().synthesize_async(text)
+
+	async def synthesize_batch_async(self, texts):
+		now = time.perf_counter()
+		for text in texts:
+			self.request_times.setdefault(text, now)
+		return await super().synthesize_batch_async(texts)
+
+
+def get_children_cpu_time():
+	if resource is None:
+		return None
+	usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return usage.ru_utime + usage.ru_stime
+
+def get_peak_rss_mb(who):
+	if resource is None:
+		return None
+	# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+	peak_rss = resource.getrusage(who).ru_maxrss
+	return round(peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def create_client(args):
+	settings = dict(PROVIDER_PROFILES[args.provider]) if args.provider else {}
+	for key in ["output_format", "sample_rate", "latency", "character_latency", "jitter"]:
+		if getattr(args, key) is not None:
+			settings[key] = getattr(args, key)
+
+	tts_client = TimedMockTTS(failure_rate=args.failure_rate, requests_per_second=args.requests_per_second, seed=args.seed, **settings)
+	tts_client.apply_eq = args.enhancement
+	tts_client.batch_size = args.batch_size
+	# Failures and throttling are retried like with the real services
+	tts_client.rate_limiter = RateLimiter(tts_client.SERVICE_NAME, max_concurrency=args.jobs)
+	return tts_client
+
+def run_soundlist(csv_file, args, output_directory):
+	tts_client = create_client(args)
+	pipeline = SynthesisPipeline(args.jobs, args.workers)
+	cpu_time = {}
+
+	start_cpu = time.process_time()
+	rows = merge_soundlists([csv_file])
+	cpu_time["read"] = time.process_time() - start_cpu
+
+	manifest = BuildManifest(os.path.join(output_directory, os.path.splitext(os.path.basename(csv_file))[0]))
+	tasks = {}
+	jasper.add_synthesis_tasks(tasks, rows, tts_client, manifest, force=True)
+	tasks = list(tasks.values())
+
+	latencies = []
+	writer_cpu_time = [0.0]
+
+	def on_file_written(task, file_path, audio_sha256):
+		# Runs in the writer thread, its CPU time so far is the time of the writing stage
+		latencies.append(time.perf_counter() - tts_client.request_times[task.text])
+		writer_cpu_time[0] = time.thread_time()
+		jasper.on_file_written(task, file_path, audio_sha256)
+
+	start_time = time.perf_counter()
+	start_cpu = time.process_time()
+	start_children_cpu = get_children_cpu_time()
+	pipeline.run(tasks, on_file_written)
+	wall_time = time.perf_counter() - start_time
+	# The process pool is shut down by now, the CPU time of its workers is in RUSAGE_CHILDREN
+	cpu_time["synthesis"] = time.process_time() - start_cpu - writer_cpu_time[0]
+	cpu_time["processing"] = None if start_children_cpu is None else get_children_cpu_time() - start_children_cpu
+	cpu_time["writing"] = writer_cpu_time[0]
+
+	start_cpu = time.process_time()
+	manifest.save()
+	cpu_time["manifest"] = time.process_time() - start_cpu
+
+	file_count = sum(len(task.file_paths) for task in tasks)
+	return {
+		"soundlist": csv_file.replace(os.sep, "/"),
+		"rows": len(rows),
+		"phrases": len(tasks),
+		"files": len(latencies),
+		"missing_files": file_count - len(latencies),
+		"wall_time": round(wall_time, 4),
+		"rows_per_second": round(len(latencies) / wall_time, 2) if wall_time > 0 else None,
+		"latency_p50": round(float(np.percentile(latencies, 50)), 4) if latencies else None,
+		"latency_p99": round(float(np.percentile(latencies, 99)), 4) if latencies else None,
+		"cpu_time": {stage: None if value is None else round(value, 4) for stage, value in cpu_time.items()},
+		"peak_rss_mb": get_peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+		"peak_rss_children_mb": get_peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None
+	}
+
+def get_totals(results):
+	wall_time = sum(result["wall_time"] for result in results)
+	files = sum(result["files"] for result in results)
+	return {
+		"soundlists": len(results),
+		"rows": sum(result["rows"] for result in results),
+		"files": files,
+		"missing_files": sum(result["missing_files"] for result in results),
+		"wall_time": round(wall_time, 4),
+		"rows_per_second": round(files / wall_time, 2) if wall_time > 0 else None
+	}
+
+def compare(baseline_file, report):
+	with open(baseline_file, "r", encoding="utf-8") as file:
+		baseline = json.load(file)
+
+	baseline_results = {result["soundlist"]: result for result in baseline["results"]}
+	print(f"Compared to {baseline_file} ({baseline['version']}, {baseline['created']}):")
+	for result in report["results"] + [dict(report["total"], soundlist="total")]:
+		previous = baseline["total"] if result["soundlist"] == "total" else baseline_results.get(result["soundlist"])
+		if previous is None or not previous.get("rows_per_second") or not result.get("rows_per_second"):
+			continue
+		change = (result["rows_per_second"] / previous["rows_per_second"] - 1) * 100
+		print(f"  {result['soundlist']}: {previous['rows_per_second']} -> {result['rows_per_second']} rows/s ({change:+.1f}%)")
+
+def main(args):
+	csv_files = jasper.find_soundlists(args.file or DEFAULT_SOUNDLISTS)
+	output_directory = tempfile.mkdtemp(prefix="jasper-benchmark-")
+	results = []
+	skipped = []
+	try:
+		for csv_file in csv_files:
+			try:
+				result = run_soundlist(csv_file, args, output_directory)
+			except UnicodeDecodeError as error:
+				# Soundlists are read in the encoding of the system, like jasper does
+				print(f"Skipping {csv_file}, it can't be read in this system's encoding: {error}")
+				skipped.append(csv_file.replace(os.sep, "/"))
+				continue
+			results.append(result)
+			print(f"{result['soundlist']}: {result['files']} files, {result['rows_per_second']} rows/s, p50 {result['latency_p50']}s, p99 {result['latency_p99']}s")
+	finally:
+		shutil.rmtree(output_directory, ignore_errors=True)
+
+	report = {
+		"version": jasper.JASPER_VERSION,
+		"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"cpu_count": os.cpu_count(),
+		"settings": {key: value for key, value in vars(args).items() if key not in ["output", "compare"]},
+		"results": results,
+		"skipped": skipped,
+		"total": get_totals(results)
+	}
+
+	output_file = args.output or os.path.join(RESULTS_DIRECTORY, f"benchmark-{jasper.JASPER_VERSION}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+	os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+	with open(output_file, "w", encoding="utf-8") as file:
+		json.dump(report, file, indent=2)
+	print(f"Total: {report['total']['files']} files in {report['total']['wall_time']}s, {report['total']['rows_per_second']} rows/s")
+	print(f"Results written to {output_file}")
+
+	if args.compare is not None:
+		compare(args.compare, report)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmarks the sound pack build with the offline mock TTS provider")
+	parser.add_argument("-f", "--file", type=str, nargs="+", help="CSV File(s), directories or glob patterns (Default: every bundled soundlist)")
+	parser.add_argument("-p", "--provider", choices=list(PROVIDER_PROFILES), help="Simulate the output format and latency of this service (Default: no latency)")
+	parser.add_argument("--output-format", choices=["wav", "mp3"], help="Audio format of the mock service")
+	parser.add_argument("--sample-rate", type=int, help="Sample rate of the mock service")
+	parser.add_argument("--latency", type=float, help="Seconds per request")
+	parser.add_argument("--character-latency", type=float, help="Seconds per character of the text")
+	parser.add_argument("--jitter", type=float, help="Random +- seconds added to the latency")
+	parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests failing with a connection error (Default: 0)")
+	parser.add_argument("--requests-per-second", type=float, help="Quota of the mock service, requests above it are throttled")
+	parser.add_argument("--seed", type=int, default=0, help="Seed for the simulated latency and failures (Default: 0)")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of synthesis requests to run at the same time (Default: 1)")
+	parser.add_argument("-w", "--workers", type=int, help="Number of processes converting the synthesized audio (Default: number of CPUs)")
+	parser.add_argument("-b", "--batch-size", type=int, default=1, help="Phrases per request (Default: 1)")
+	parser.add_argument("-e", "--enhancement", help="Apply the audio enhancement", action="store_true")
+	parser.add_argument("-o", "--output", type=str, help=f"Result file (Default: {RESULTS_DIRECTORY}{os.sep}benchmark-<version>-<time>.json)")
+	parser.add_argument("-c", "--compare", type=str, help="Earlier result file to compare the rows/s with")
+	main(parser.parse_args())
@@ -1,15 +1,55 @@
+import copy
+import json
+import queue
 import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 
 import customtkinter
+import sounddevice as sd
 import yaml
 
-from ttsproviders.amazonpolly import AmazonPollyTTS
-from ttsproviders.elevenlabs import ElevenLabsTTS
-from ttsproviders.googletts import GoogleTTS
-from ttsproviders.ibmwatson import IBMWatsonTTS
-from ttsproviders.microsoftazure import MicrosoftAzureTTS
+from ttsproviders.registry import get_provider_class
+from ttsproviders.voicecatalog import CATALOG_DIR, CATALOG_TTL, VoiceCatalog
 
 CONFIG = None
+VOICE_CATALOG = None
+PREVIEW_CACHE_SIZE = 200 * 1024 * 1024
+
+
+# In-memory LRU of decoded preview audio, keyed by the service, all voice settings and the text.
+# The least recently played clips are dropped once the samples take more than max_size bytes.
+class PreviewCache:
+	def __init__(self, max_size=PREVIEW_CACHE_SIZE):
+		self._max_size = max_size
+		self._size = 0
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+	
+	@staticmethod
+	def get_key(tts_client, text):
+		return (tts_client.SERVICE_NAME, json.dumps(tts_client.get_voice_properties(), sort_keys=True), text)
+	
+	def get(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				self._entries.move_to_end(key)
+			return entry
+	
+	def put(self, key, samples, sample_rate):
+		with self._lock:
+			if key in self._entries:
+				self._size -= self._entries.pop(key)[0].nbytes
+			self._entries[key] = (samples, sample_rate)
+			self._size += samples.nbytes
+			while self._size > self._max_size and len(self._entries) > 1:
+				self._size -= self._entries.popitem(last=False)[1][0].nbytes
+
+
+PREVIEW_CACHE = PreviewCache()
 
 def load_config():
 	global CONFIG
@@ -24,29 +64,204 @@ def load_config():
 		print("Config file missing. Copy & edit config_example.yaml")
 		sys.exit(1)
 
+def init_voice_catalog():
+	global VOICE_CATALOG
+	# Voice lists are read from the local catalog, only missing or outdated ones are requested
+	catalog_config = CONFIG.get("voice_catalog") or {}
+	VOICE_CATALOG = VoiceCatalog(catalog_config.get("directory", CATALOG_DIR), float(catalog_config.get("ttl_hours", CATALOG_TTL / 3600)) * 3600)
+
+
+# Creates the TTS client and loads the voice list on a background thread, a placeholder is shown
+# until the widgets of the provider can be built. Previews are synthesized on worker threads as
+# well. Tk may only be used from the main thread, so results are picked up by polling with after().
+# A provider frame that misses one of the abstract hooks can't be created at all.
+class ProviderFrame(customtkinter.CTkFrame, ABC):
+	TITLE = "Text-to-Speech"
+	LOAD_POLL_INTERVAL = 100
+	PREVIEW_POLL_INTERVAL = 50
+	# After a preview the next voice of the dropdown is synthesized in the background
+	PREFETCH_NEXT_VOICE = True
 
-class GoogleTTSFrame(customtkinter.CTkFrame):
 	def __init__(self, master, **kwargs):
 		super().__init__(master, **kwargs)
 		
-		self._tts_client = GoogleTTS(r"googletts_cred.json")
+		self._tts_client = None
+		self._voices = None
+		self._load_result = None
+		self._preview_id = 0
+		self._pending_previews = 0
+		self._preview_results = queue.Queue()
+		self._prefetching = False
+		self._preview_timings = {}
+		
+		self.grid_columnconfigure(0, weight=1)
+		self.grid_columnconfigure(1, weight=1)
+		
+		self.label = customtkinter.CTkLabel(self, text=self.TITLE, font=customtkinter.CTkFont(size=20, weight="bold"))
+		self.label.grid(row=0, column=0, padx=20, pady=20, sticky="ew", columnspan=2)
+		
+		self.loading_label = customtkinter.CTkLabel(self, text="Loading voices..")
+		self.loading_label.grid(row=1, column=0, padx=20, pady=20, sticky="ew", columnspan=2)
 		
-		self._voices = self._tts_client.get_voices()
+		threading.Thread(target=self._load, name=f"jasper-load-{self.__class__.__name__}", daemon=True).start()
+		self.after(self.LOAD_POLL_INTERVAL, self._poll_load)
+	
+	@abstractmethod
+	def create_client(self):
+		pass
+	
+	@abstractmethod
+	def create_widgets(self):
+		pass
+	
+	def get_voice_id(self, value):
+		# Maps an entry of the voice dropdown to the voice property of the client
+		return value
+	
+	def preview_button_callback(self):
+		text = self.preview_text_entry.get()
+		print(f"Playing preview with {self._tts_client.SERVICE_NAME} | Text: {text} | Voice: {self.voice_select.get()}")
+		
+		# Pressing Play again cancels the clip that is playing and any preview still synthesizing
+		self._preview_id += 1
+		sd.stop()
+		
+		cached_preview = PREVIEW_CACHE.get(PREVIEW_CACHE.get_key(self._tts_client, text))
+		if cached_preview is not None:
+			sd.play(*cached_preview)
+			self.preview_status_label.configure(text="Played from memory")
+			self._prefetch_next_voice(text)
+			return
+		
+		# The sliders may move while the preview is synthesized, the worker gets its own copy
+		tts_client = copy.copy(self._tts_client)
+		self.preview_status_label.configure(text="Synthesizing..")
+		self._preview_timings = {}
+		self._pending_previews += 1
+		threading.Thread(target=self._preview, args=(self._preview_id, tts_client, text), name="jasper-preview", daemon=True).start()
+		if self._pending_previews == 1:
+			self.after(self.PREVIEW_POLL_INTERVAL, self._poll_preview)
+	
+	def _preview(self, preview_id, tts_client, text):
+		# Runs on a worker thread, reports back through the result queue. The audio is played while
+		# it is still arriving and stops once a newer preview was started.
+		start = time.perf_counter()
+		
+		def on_progress(event):
+			self._preview_results.put((preview_id, event, time.perf_counter() - start))
+		
+		try:
+			samples, sample_rate = tts_client.play_text(text, lambda: preview_id != self._preview_id, on_progress)
+		except Exception as e:
+			self._preview_results.put((preview_id, "error", e))
+			return
+		
+		if samples is not None:
+			PREVIEW_CACHE.put(PREVIEW_CACHE.get_key(tts_client, text), samples, sample_rate)
+			self._preview_results.put((preview_id, "done", None))
+		elif preview_id != self._preview_id:
+			self._preview_results.put((preview_id, "cancelled", None))
+		else:
+			self._preview_results.put((preview_id, "error", "No audio received"))
+	
+	def _poll_preview(self):
+		while not self._preview_results.empty():
+			preview_id, state, value = self._preview_results.get()
+			# Progress events come before the one final state of every preview
+			if state in ("received", "first_audio"):
+				if preview_id == self._preview_id:
+					self._preview_timings[state] = value
+					self._show_preview_timings()
+				continue
+			
+			self._pending_previews -= 1
+			if preview_id != self._preview_id:
+				continue
+			if state == "done":
+				self._prefetch_next_voice(self.preview_text_entry.get())
+			elif state == "error":
+				print(f"Preview failed: {value}")
+				self.preview_status_label.configure(text=f"Preview failed: {value}")
+		
+		if self._pending_previews > 0:
+			self.after(self.PREVIEW_POLL_INTERVAL, self._poll_preview)
+	
+	def _show_preview_timings(self):
+		labels = [("first_audio", "First audio"), ("received", "Synthesis")]
+		text = " | ".join(f"{label}: {self._preview_timings[event] * 1000:.0f} ms" for event, label in labels if event in self._preview_timings)
+		self.preview_status_label.configure(text=text)
+	
+	def _prefetch_next_voice(self, text):
+		values = self.voice_select.cget("values")
+		current = self.voice_select.get()
+		if not self.PREFETCH_NEXT_VOICE or self._prefetching or current not in values:
+			return
+		index = values.index(current)
+		if index + 1 >= len(values):
+			return
+		
+		self._prefetching = True
+		tts_client = copy.copy(self._tts_client)
+		threading.Thread(target=self._prefetch, args=(tts_client, self.get_voice_id(values[index + 1]), text), name="jasper-prefetch", daemon=True).start()
+	
+	def _prefetch(self, tts_client, voice_id, text):
+		# Runs on a worker thread, only fills the preview cache
+		try:
+			tts_client.set_property_by_name(tts_client.VOICE_PROPERTY, voice_id)
+			key = PREVIEW_CACHE.get_key(tts_client, text)
+			if PREVIEW_CACHE.get(key) is None:
+				samples, sample_rate = tts_client.synthesize_preview(text)
+				if samples is not None:
+					PREVIEW_CACHE.put(key, samples, sample_rate)
+		except Exception as e:
+			print(f"Prefetching voice {voice_id} failed: {e}")
+		finally:
+			self._prefetching = False
+	
+	def _load(self):
+		# Runs on the background thread, no widgets may be touched here
+		try:
+			tts_client = self.create_client()
+			tts_client.voice_catalog = VOICE_CATALOG
+			self._load_result = (tts_client, tts_client.get_catalog_voices(), None)
+		except Exception as e:
+			self._load_result = (None, None, e)
+	
+	def _poll_load(self):
+		if self._load_result is None:
+			self.after(self.LOAD_POLL_INTERVAL, self._poll_load)
+			return
+		
+		tts_client, voices, error = self._load_result
+		if error is not None:
+			print(f"Error on initilization of {self.TITLE}: {error}")
+			self.loading_label.configure(text=f"Could not load voices: {error}", wraplength=400)
+			return
+		
+		self.loading_label.destroy()
+		self._tts_client = tts_client
+		self._voices = voices
+		self.create_widgets()
+		
+		self.preview_status_label = customtkinter.CTkLabel(self, text="")
+		self.preview_status_label.grid(row=self.grid_size()[1], column=0, padx=20, pady=(0,20), columnspan=2)
+
+
+class GoogleTTSFrame(ProviderFrame):
+	TITLE = "Google Cloud Text-to-Speech"
+
+	def create_client(self):
+		return get_provider_class("google")(r"googletts_cred.json")
+	
+	def create_widgets(self):
 		lang_values = []
 		
 		for voice in self._voices:
-			if voice.language_codes[0] not in lang_values:
-				lang_values.append(voice.language_codes[0])
+			if voice["language"] not in lang_values:
+				lang_values.append(voice["language"])
 		
 		lang_values.sort()
 		
-		self.grid_columnconfigure(0, weight=1)
-		self.grid_columnconfigure(1, weight=1)
-
-		# add widgets onto the frame, for example:
-		self.label = customtkinter.CTkLabel(self, text="Google Cloud Text-to-Speech", font=customtkinter.CTkFont(size=20, weight="bold"))
-		self.label.grid(row=0, column=0, padx=20, pady=20, sticky="ew", columnspan=2)
-		
 		self.language_select = customtkinter.CTkOptionMenu(self, values=lang_values, command=self.language_select_callback)
 		self.language_select.grid(row=1, column=0, padx=20, pady=20, sticky="ew")
 		self.voice_select = customtkinter.CTkOptionMenu(self, command=self.voice_select_callback)
@@ -79,8 +294,8 @@ class GoogleTTSFrame(customtkinter.CTkFrame):
 	def language_select_callback(self, value):
 		selected_voice_names = []
 		for voice in self._voices:
-			if voice.language_codes[0].startswith(value):
-				selected_voice_names.append(voice.name)
+			if voice["language"].startswith(value):
+				selected_voice_names.append(voice["id"])
 		
 		selected_voice_names.sort()
 		self._tts_client.language = value
@@ -98,29 +313,18 @@ class GoogleTTSFrame(customtkinter.CTkFrame):
 	def pitch_slider_callback(self, value):
 		self.pitch_slider_description_label.configure(text=f"Pitch: {value:3.2f}")
 		self._tts_client.pitch = value
-	
-	def preview_button_callback(self):
-		print(f"Playing preview with {self._tts_client.SERVICE_NAME} | Text: {self.preview_text_entry.get()} | Voice: {self.voice_select.get()}")
-		self._tts_client.play_text(self.preview_text_entry.get())
 
-class ElevenLabsTTSFrame(customtkinter.CTkFrame):
-	def __init__(self, master, **kwargs):
-		super().__init__(master, **kwargs)
-		
-		self._tts_client = ElevenLabsTTS(CONFIG["elevenlabs"]["api_key"], "jsCqWAovK2LkecY7zXl4")
-		
-		self._voices = self._tts_client.get_voices()
+class ElevenLabsTTSFrame(ProviderFrame):
+	TITLE = "ElevenLabs Text-to-Speech"
+
+	def create_client(self):
+		return get_provider_class("elevenlabs")(CONFIG["elevenlabs"]["api_key"], "jsCqWAovK2LkecY7zXl4", voice_catalog=VOICE_CATALOG)
+	
+	def create_widgets(self):
 		voice_names = []
 		
 		for voice in self._voices:
-			voice_names.append(f"{voice.name} ({voice.labels['gender']}) ID:{voice.voice_id}")
-		
-		self.grid_columnconfigure(0, weight=1)
-		self.grid_columnconfigure(1, weight=1)
-	
-		# add widgets onto the frame, for example:
-		self.label = customtkinter.CTkLabel(self, text="ElevenLabs Text-to-Speech", font=customtkinter.CTkFont(size=20, weight="bold"))
-		self.label.grid(row=0, column=0, padx=20, pady=20, sticky="ew", columnspan=2)
+			voice_names.append(f"{voice['name']} ({voice['gender']}) ID:{voice['id']}")
 		
 		self.voice_select = customtkinter.CTkOptionMenu(self, values=voice_names, command=self.voice_select_callback)
 		self.voice_select.grid(row=1, column=0, padx=20, pady=20, sticky="ew", columnspan=2)
@@ -159,9 +363,11 @@ class ElevenLabsTTSFrame(customtkinter.CTkFrame):
 		self.preview_button = customtkinter.CTkButton(self, height=40, width=120, text="Play", font=customtkinter.CTkFont(size=18, weight="bold"), command=self.preview_button_callback)
 		self.preview_button.grid(row=11, column=0, pady=(0,20), columnspan=2)
 	
+	def get_voice_id(self, value):
+		return value[value.find("ID:")+3:]
+	
 	def voice_select_callback(self, value):
-		extracted_id = value[value.find("ID:")+3:]
-		self._tts_client.voice_id = extracted_id
+		self._tts_client.voice_id = self.get_voice_id(value)
 		self.stability_slider.set(self._tts_client.stability)
 		self.similarity_slider.set(self._tts_client.similarity)
 		self.style_slider.set(self._tts_client.style)
@@ -182,33 +388,22 @@ class ElevenLabsTTSFrame(customtkinter.CTkFrame):
 	
 	def speaker_boost_checkbox_event(self):
 		self._tts_client.speaker_boost = self.speaker_boost_checkbox.get()
-	
-	def preview_button_callback(self):
-		print(f"Playing preview with {self._tts_client.SERVICE_NAME} | Text: {self.preview_text_entry.get()} | Voice: {self.voice_select.get()}")
-		self._tts_client.play_text(self.preview_text_entry.get())
 
-class AmazonPollyTTSTTSFrame(customtkinter.CTkFrame):
-	def __init__(self, master, **kwargs):
-		super().__init__(master, **kwargs)
-		
-		self._tts_client = AmazonPollyTTS(CONFIG["amazonpolly"]["aws_access_key_id"], CONFIG["amazonpolly"]["aws_secret_access_key"], voice_id="Ruth")
-		
-		self._voices = self._tts_client.get_voices()
+class AmazonPollyTTSTTSFrame(ProviderFrame):
+	TITLE = "Amazon Polly Text-to-Speech"
+
+	def create_client(self):
+		return get_provider_class("amazon")(CONFIG["amazonpolly"]["aws_access_key_id"], CONFIG["amazonpolly"]["aws_secret_access_key"], voice_id="Ruth")
+	
+	def create_widgets(self):
 		lang_values = []
 		
 		for voice in self._voices:
-			if voice.get("LanguageCode") not in lang_values:
-				lang_values.append(voice.get("LanguageCode"))
+			if voice["language"] not in lang_values:
+				lang_values.append(voice["language"])
 		
 		lang_values.sort()
 		
-		self.grid_columnconfigure(0, weight=1)
-		self.grid_columnconfigure(1, weight=1)
-	
-		# add widgets onto the frame, for example:
-		self.label = customtkinter.CTkLabel(self, text="Amazon Polly Text-to-Speech", font=customtkinter.CTkFont(size=20, weight="bold"))
-		self.label.grid(row=0, column=0, padx=20, pady=20, sticky="ew", columnspan=2)
-		
 		self.language_select = customtkinter.CTkOptionMenu(self, values=lang_values, command=self.language_select_callback)
 		self.language_select.grid(row=1, column=0, padx=20, pady=20, sticky="ew")
 		self.voice_select = customtkinter.CTkOptionMenu(self, command=self.voice_select_callback)
@@ -227,8 +422,8 @@ class AmazonPollyTTSTTSFrame(customtkinter.CTkFrame):
 	def language_select_callback(self, value):
 		selected_voice_names = []
 		for voice in self._voices:
-			if voice.get("LanguageCode").startswith(value):
-				selected_voice_names.append(voice.get("Id"))
+			if voice["language"].startswith(value):
+				selected_voice_names.append(voice["id"])
 		
 		selected_voice_names.sort()
 		self._tts_client.language = value
@@ -238,33 +433,22 @@ class AmazonPollyTTSTTSFrame(customtkinter.CTkFrame):
 	
 	def voice_select_callback(self, value):
 		self._tts_client.voice_id = value
-	
-	def preview_button_callback(self):
-		print(f"Playing preview with {self._tts_client.SERVICE_NAME} | Text: {self.preview_text_entry.get()} | Voice: {self.voice_select.get()}")
-		self._tts_client.play_text(self.preview_text_entry.get())
 
-class MicrosoftAzureTTSFrame(customtkinter.CTkFrame):
-	def __init__(self, master, **kwargs):
-		super().__init__(master, **kwargs)
-		
-		self._tts_client = MicrosoftAzureTTS(CONFIG["microsoftazure"]["speech_security_key"])
-		
-		self._voices = self._tts_client.get_voices()
+class MicrosoftAzureTTSFrame(ProviderFrame):
+	TITLE = "Microsoft Azure Text-to-Speech"
+
+	def create_client(self):
+		return get_provider_class("microsoft")(CONFIG["microsoftazure"]["speech_security_key"])
+	
+	def create_widgets(self):
 		lang_values = []
 		
 		for voice in self._voices:
-			if voice.locale not in lang_values:
-				lang_values.append(voice.locale)
+			if voice["language"] not in lang_values:
+				lang_values.append(voice["language"])
 		
 		lang_values.sort()
 		
-		self.grid_columnconfigure(0, weight=1)
-		self.grid_columnconfigure(1, weight=1)
-	
-		# add widgets onto the frame, for example:
-		self.label = customtkinter.CTkLabel(self, text="Microsoft Azure Text-to-Speech", font=customtkinter.CTkFont(size=20, weight="bold"))
-		self.label.grid(row=0, column=0, padx=20, pady=20, sticky="ew", columnspan=2)
-		
 		self.language_select = customtkinter.CTkOptionMenu(self, values=lang_values, command=self.language_select_callback)
 		self.language_select.grid(row=1, column=0, padx=20, pady=20, sticky="ew")
 		self.voice_select = customtkinter.CTkOptionMenu(self, command=self.voice_select_callback)
@@ -297,8 +481,8 @@ class MicrosoftAzureTTSFrame(customtkinter.CTkFrame):
 	def language_select_callback(self, value):
 		selected_voice_names = []
 		for voice in self._voices:
-			if voice.locale.startswith(value):
-				selected_voice_names.append(voice.short_name)
+			if voice["language"].startswith(value):
+				selected_voice_names.append(voice["id"])
 		
 		selected_voice_names.sort()
 		self._tts_client.language = value
@@ -316,33 +500,22 @@ class MicrosoftAzureTTSFrame(customtkinter.CTkFrame):
 	def pitch_slider_callback(self, value):
 		self.pitch_slider_description_label.configure(text=f"Pitch: {value}")
 		self._tts_client.pitch = value
-	
-	def preview_button_callback(self):
-		print(f"Playing preview with {self._tts_client.SERVICE_NAME} | Text: {self.preview_text_entry.get()} | Voice: {self.voice_select.get()}")
-		self._tts_client.play_text(self.preview_text_entry.get())
 
-class IBMWatsonTTSFrame(customtkinter.CTkFrame):
-	def __init__(self, master, **kwargs):
-		super().__init__(master, **kwargs)
-		
-		self._tts_client = IBMWatsonTTS(CONFIG["ibmwatson"]["api_key"], CONFIG["ibmwatson"]["api_url"])
-		
-		self._voices = self._tts_client.get_voices()
+class IBMWatsonTTSFrame(ProviderFrame):
+	TITLE = "IBM Watson Text-to-Speech"
+
+	def create_client(self):
+		return get_provider_class("ibm")(CONFIG["ibmwatson"]["api_key"], CONFIG["ibmwatson"]["api_url"])
+	
+	def create_widgets(self):
 		lang_values = []
 		
 		for voice in self._voices:
-			if voice.get("language") not in lang_values:
-				lang_values.append(voice.get("language"))
+			if voice["language"] not in lang_values:
+				lang_values.append(voice["language"])
 		
 		lang_values.sort()
 		
-		self.grid_columnconfigure(0, weight=1)
-		self.grid_columnconfigure(1, weight=1)
-	
-		# add widgets onto the frame, for example:
-		self.label = customtkinter.CTkLabel(self, text="IBM Watson Text-to-Speech", font=customtkinter.CTkFont(size=20, weight="bold"))
-		self.label.grid(row=0, column=0, padx=20, pady=20, sticky="ew", columnspan=2)
-		
 		self.language_select = customtkinter.CTkOptionMenu(self, values=lang_values, command=self.language_select_callback)
 		self.language_select.grid(row=1, column=0, padx=20, pady=20, sticky="ew")
 		self.voice_select = customtkinter.CTkOptionMenu(self, command=self.voice_select_callback)
@@ -375,8 +548,8 @@ class IBMWatsonTTSFrame(customtkinter.CTkFrame):
 	def language_select_callback(self, value):
 		selected_voice_names = []
 		for voice in self._voices:
-			if voice.get("language").startswith(value):
-				selected_voice_names.append(voice.get("name"))
+			if voice["language"].startswith(value):
+				selected_voice_names.append(voice["id"])
 		
 		selected_voice_names.sort()
 		self._tts_client.language = value
@@ -394,10 +567,6 @@ class IBMWatsonTTSFrame(customtkinter.CTkFrame):
 	def pitch_slider_callback(self, value):
 		self.pitch_slider_description_label.configure(text=f"Pitch: {value}")
 		self._tts_client.pitch = value
-	
-	def preview_button_callback(self):
-		print(f"Playing preview with {self._tts_client.SERVICE_NAME} | Text: {self.preview_text_entry.get()} | Voice: {self.voice_select.get()}")
-		self._tts_client.play_text(self.preview_text_entry.get())
 
 class App(customtkinter.CTk):
 	def __init__(self):
@@ -424,43 +593,31 @@ class App(customtkinter.CTk):
 		self.tts_option_menu = customtkinter.CTkOptionMenu(self.navigation_frame, width=150, values=["Google TTS", "ElevenLabsTTS", "Amazon Polly TTS", "Microsoft Azure TTS", "IBM Watson TTS"],  anchor="w", command=self.tts_option_callback)
 		self.tts_option_menu.grid(row=1, column=0, padx=20, pady=20, sticky="ew")
 		
-		self.googletts_frame = GoogleTTSFrame(master=self)
-		self.elevenlabs_frame = ElevenLabsTTSFrame(master=self)
-		self.amazonpolly_frame = AmazonPollyTTSTTSFrame(master=self)
-		self.microsoftazure_frame = MicrosoftAzureTTSFrame(master=self)
-		self.ibmwatson_frame = IBMWatsonTTSFrame(master=self)
+		# Frames are created the first time they are shown and load their provider in the background,
+		# the window shows up right away and a slow provider doesn't block the others
+		self._frame_classes = {
+			"Google TTS": GoogleTTSFrame,
+			"ElevenLabsTTS": ElevenLabsTTSFrame,
+			"Amazon Polly TTS": AmazonPollyTTSTTSFrame,
+			"Microsoft Azure TTS": MicrosoftAzureTTSFrame,
+			"IBM Watson TTS": IBMWatsonTTSFrame
+		}
+		self._frames = {}
 		
 		self.tts_option_callback("Google TTS")
 	
 	def tts_option_callback(self, value):
-		if value == "Google TTS":
-			self.googletts_frame.grid(row=0, column=1, padx=20, pady=20, sticky="nsew")
-		else:
-			self.googletts_frame.grid_forget()
-			
-		if value == "ElevenLabsTTS":
-			self.elevenlabs_frame.grid(row=0, column=1, padx=20, pady=20, sticky="nsew")
-		else:
-			self.elevenlabs_frame.grid_forget()
-		
-		if value == "Amazon Polly TTS":
-			self.amazonpolly_frame.grid(row=0, column=1, padx=20, pady=20, sticky="nsew")
-		else:
-			self.amazonpolly_frame.grid_forget()
+		for frame in self._frames.values():
+			frame.grid_forget()
 		
-		if value == "Microsoft Azure TTS":
-			self.microsoftazure_frame.grid(row=0, column=1, padx=20, pady=20, sticky="nsew")
-		else:
-			self.microsoftazure_frame.grid_forget()
-		
-		if value == "IBM Watson TTS":
-			self.ibmwatson_frame.grid(row=0, column=1, padx=20, pady=20, sticky="nsew")
-		else:
-			self.ibmwatson_frame.grid_forget()
+		if value not in self._frames:
+			self._frames[value] = self._frame_classes[value](master=self)
+		self._frames[value].grid(row=0, column=1, padx=20, pady=20, sticky="nsew")
 
 
 if __name__ == "__main__":
 	load_config()
+	init_voice_catalog()
 
 	app = App()
 	app.mainloop()
@@ -1,18 +1,42 @@
 import argparse
-import csv
+import functools
+import glob
+import json
 import os
 import sys
 
 import yaml
 
-from ttsproviders.amazonpolly import AmazonPollyTTS
-from ttsproviders.elevenlabs import ElevenLabsTTS
-from ttsproviders.googletts import GoogleTTS
-from ttsproviders.ibmwatson import IBMWatsonTTS
-from ttsproviders.microsoftazure import MicrosoftAzureTTS
+from soundpack.manifest import BuildManifest
+from soundpack.pipeline import SynthesisPipeline, SynthesisTask
+from soundpack.scheduler import LATENCY_FILE, CostModel
+from soundpack.shards import filter_rows, find_sharded_soundpacks, get_shard_directory, get_shard_info, merge_shards, parse_shard, verify_shards
+from soundpack.soundlist import merge_soundlists
+from ttsproviders.atomicfile import TEMP_FILE_SUFFIX
+from ttsproviders.ratelimiter import RateLimiter
+from ttsproviders.registry import SERVICES, get_config_section, get_provider_class
+from ttsproviders.tracing import Tracer, profile_run, span
+from ttsproviders.ttscache import CACHE_DIR, CACHE_MAX_SIZE, TTSCache
+from ttsproviders.voicecatalog import CATALOG_DIR, CATALOG_TTL, VoiceCatalog
 
 OUTPUT_DIRECTORY = "output"
 JASPER_VERSION = "v1.0"
+SOUNDPACK_NAME_PLACEHOLDER = "{name}"
+VOICE_NAME_PLACEHOLDER = "{voice}"
+
+
+# How a build runs, the same for every voice and sound pack of it
+class BuildOptions:
+	def __init__(self, jobs=1, workers=None, use_cache=True, force=False, resume=False, tracer=None, output_directory=OUTPUT_DIRECTORY, shard=None):
+		self.jobs = jobs
+		self.workers = workers
+		self.use_cache = use_cache
+		self.force = force
+		self.resume = resume
+		self.tracer = tracer
+		self.output_directory = output_directory
+		# (i, N) to build only shard i of N
+		self.shard = shard
 
 
 def load_config():
@@ -28,40 +52,124 @@ def load_config():
 		sys.exit(1)
 	return config
 
-def read_csv_file_and_create_audio(csv_file, output_dir, soundpack_dir, tts_client):
-	character_count = 0
-	with open(csv_file, "r") as csv_content:
-		dialect = csv.Sniffer().sniff(csv_content.read(), delimiters=";,")
-		csv_content.seek(0)
-		csv_reader = csv.reader(csv_content, dialect=dialect)
-		for row in csv_reader:
-			file_dir = row[0]
-			file_name = row[1]
-			complete_path = f"{output_dir}{os.sep}{soundpack_dir}{os.sep}{file_dir}{os.sep}{file_name}"
-			text = row[2]
-
-			if text is None or text == "":
-				print(f"Empty text for {file_name}. Skipping entry..")
-				continue
-			
-			if not os.path.exists(os.path.dirname(complete_path)):
-				os.makedirs(os.path.dirname(complete_path))
-			
-			tts_client.save_file(text, complete_path)
-			character_count += len(text)
-	print(f"Synthesized {character_count} characters")
+def get_synthesis_parameters(tts_client):
+	return {
+		"service": tts_client.SERVICE_NAME,
+		"properties": tts_client.get_voice_properties(),
+		"apply_eq": tts_client.apply_eq
+	}
+
+def add_synthesis_tasks(tasks, rows, tts_client, manifest, force=False):
+	# tasks maps (synthesis parameters, text) to a task and is shared by all sound packs of a run
+	synthesis = get_synthesis_parameters(tts_client)
+	synthesis_key = json.dumps(synthesis, sort_keys=True)
+	skipped_count = 0
+	for row in rows:
+		# --force still skips the files a resumed build already regenerated
+		if (not force or row.relative_path in manifest.resumed_entries) and manifest.is_unchanged(row.relative_path, row.text, synthesis):
+			manifest.keep(row.relative_path, row.source)
+			skipped_count += 1
+			continue
+		
+		# Rows with the same text and voice are synthesized once and written to every path
+		task = tasks.get((synthesis_key, row.text))
+		if task is None:
+			task = SynthesisTask(tts_client, row.text, [], {"synthesis": synthesis, "rows": {}})
+			tasks[(synthesis_key, row.text)] = task
+		file_path = manifest.get_file_path(row.relative_path)
+		task.file_paths.append(file_path)
+		task.context["rows"][file_path] = (manifest, row)
+	
+	return skipped_count
+
+def on_file_written(task, file_path, audio_sha256):
+	manifest, row = task.context["rows"][file_path]
+	manifest.add(row.relative_path, row.source, task.context["synthesis"], audio_sha256)
+
+def create_audio_files(tasks, pipeline):
+	character_count = sum(len(task.text) for task in tasks)
+	row_character_count = sum(len(task.text) * len(task.file_paths) for task in tasks)
+	duplicate_count = sum(len(task.file_paths) - 1 for task in tasks)
+	# Phrases in the cache are not requested from the service
+	cached_tasks = [task for task in tasks if task.tts_client.is_cached(task.text)]
+	cached_character_count = sum(len(task.text) for task in cached_tasks)
+	
+	pipeline.run(tasks, on_file_written)
+	print(f"Synthesized {character_count - cached_character_count} characters")
+	if len(cached_tasks) > 0:
+		print(f"Used the cache for {len(cached_tasks)} phrases with {cached_character_count} characters")
+	if duplicate_count > 0:
+		print(f"Saved {row_character_count - character_count} characters by reusing {len(tasks)} phrases for {duplicate_count} duplicate rows")
+
+def init_tts_cache(config):
+	cache_config = config.get("cache") or {}
+	directory = cache_config.get("directory", CACHE_DIR)
+	max_size = int(float(cache_config.get("max_size_mb", CACHE_MAX_SIZE / (1024 * 1024))) * 1024 * 1024)
+	
+	cache = TTSCache(directory, max_size)
+	print(f"Using synthesis cache in '{directory}' ({cache.size / (1024 * 1024):.1f} of {max_size / (1024 * 1024):.0f} MB used)")
+	return cache
 
-def init_tts_client(service, config, overwrites, enhancement):
+def init_voice_catalog(config):
+	catalog_config = config.get("voice_catalog") or {}
+	directory = catalog_config.get("directory", CATALOG_DIR)
+	ttl = float(catalog_config.get("ttl_hours", CATALOG_TTL / 3600)) * 3600
+	return VoiceCatalog(directory, ttl)
+
+def validate_voice(tts_client):
+	voice_id = tts_client.get_voice_properties()[tts_client.VOICE_PROPERTY]
 	try:
-		config = load_config()
+		valid = tts_client.validate_voice()
+	except Exception as e:
+		# A build must not depend on the voice list, the synthesis reports a wrong voice anyway
+		print(f"{tts_client.SERVICE_NAME}: Could not check voice {voice_id}: {e}")
+		return
+	if not valid:
+		print(f"{tts_client.SERVICE_NAME}: Voice {voice_id} not found in the voice list of the service")
+		sys.exit(1)
+
+def find_soundlists(patterns):
+	# Accepts csv files, directories containing csv files and glob patterns
+	csv_files = []
+	for pattern in patterns:
+		if os.path.isdir(pattern):
+			matches = sorted(glob.glob(os.path.join(pattern, "*.csv")))
+		elif glob.has_magic(pattern):
+			matches = sorted(glob.glob(pattern))
+		else:
+			matches = [pattern]
 		
+		if not matches:
+			print(f"No soundlists found for '{pattern}'")
+			sys.exit(1)
+		for csv_file in matches:
+			if csv_file not in csv_files:
+				csv_files.append(csv_file)
+	return csv_files
+
+def get_soundpacks(csv_files, soundpack_name):
+	# With a {name} placeholder every soundlist becomes its own sound pack,
+	# otherwise all soundlists are combined into one
+	if SOUNDPACK_NAME_PLACEHOLDER not in soundpack_name:
+		return {soundpack_name: csv_files}
+	
+	soundpacks = {}
+	for csv_file in csv_files:
+		soundlist_name = os.path.splitext(os.path.basename(csv_file))[0]
+		soundpacks.setdefault(soundpack_name.replace(SOUNDPACK_NAME_PLACEHOLDER, soundlist_name), []).append(csv_file)
+	return soundpacks
+
+def init_tts_client(service, config, overwrites, enhancement, voice_catalog=None):
+	try:
 		print("Initializing TTS Client")
+		# Only the provider of the selected service gets imported
+		provider_class = get_provider_class(service)
 		if service == "google":
 			if not os.path.isfile(r"googletts_cred.json"):
 				print("Missing Google TTS credentials file!")
 				sys.exit(1)
 			
-			client = GoogleTTS(
+			client = provider_class(
 				credentials_file = 	r"googletts_cred.json",
 				language = 			config["googletts"]["language"], 
 				voice_name = 		config["googletts"]["voice_name"], 
@@ -71,16 +179,17 @@ def init_tts_client(service, config, overwrites, enhancement):
 			)
 				
 		elif service == "elevenlabs":
-			client = ElevenLabsTTS(
+			client = provider_class(
 				api_key = 		config["elevenlabs"]["api_key"],
 				voice_id = 		config["elevenlabs"]["voice_id"],
 				stability = 	float(config["elevenlabs"]["stability"]),
 				similarity = 	float(config["elevenlabs"]["similarity"]),
 				style = 		float(config["elevenlabs"]["style"]),
-				speaker_boost = bool(config["elevenlabs"]["speaker_boost"])
+				speaker_boost = bool(config["elevenlabs"]["speaker_boost"]),
+				voice_catalog = voice_catalog
 			)
 		elif service == "amazon":
-			client = AmazonPollyTTS(
+			client = provider_class(
 				aws_access_key_id = 	config["amazonpolly"]["aws_access_key_id"],
 				aws_secret_access_key = config["amazonpolly"]["aws_secret_access_key"],
 				region_name = 			config["amazonpolly"]["region_name"],
@@ -89,35 +198,50 @@ def init_tts_client(service, config, overwrites, enhancement):
 				voice_id = 				config["amazonpolly"]["voice_id"]
 			)
 		elif service == "microsoft":
-			client = MicrosoftAzureTTS(
+			client = provider_class(
 				speech_security_key = 	config["microsoftazure"]["speech_security_key"],
 				region_name = 			config["microsoftazure"]["region_name"],
 				language = 				config["microsoftazure"]["language"],
 				voice_id = 				config["microsoftazure"]["voice_id"],
 				speaking_rate = 		float(config["microsoftazure"]["speaking_rate"]),
 				pitch = 				int(config["microsoftazure"]["pitch"]),
-				output_format = 		config["microsoftazure"]["output_format"]
+				output_format = 		config["microsoftazure"].get("output_format", "auto")
 			)
 		elif service == "ibm":
-			client = IBMWatsonTTS(
+			client = provider_class(
 				api_key = 		config["ibmwatson"]["api_key"],
 				api_url = 		config["ibmwatson"]["api_url"],
 				voice_name = 	config["ibmwatson"]["voice_name"],
 				speaking_rate = int(config["ibmwatson"]["speaking_rate"]),
 				pitch = 		int(config["ibmwatson"]["pitch"])
 			)
-		else:
-			print("Service not found. Exiting..")
-			sys.exit(1)
+		elif service == "mock":
+			# Offline stand-in for dry runs, every setting is optional
+			mock_config = config.get("mocktts") or {}
+			client = provider_class(
+				voice_id = 				mock_config.get("voice_id", "mock-mid"),
+				output_format = 		mock_config.get("output_format", "wav"),
+				sample_rate = 			int(mock_config.get("sample_rate", 24000)),
+				latency = 				float(mock_config.get("latency", 0.0)),
+				character_latency = 	float(mock_config.get("character_latency", 0.0)),
+				jitter = 				float(mock_config.get("jitter", 0.0)),
+				failure_rate = 			float(mock_config.get("failure_rate", 0.0)),
+				requests_per_second = 	mock_config.get("requests_per_second")
+			)
 		
+		client.set_property_by_name("apply_eq", enhancement)
+		client.voice_catalog = voice_catalog
+		service_config = config.get(get_config_section(service)) or {}
+		client.rate_limiter = RateLimiter.from_config(client.SERVICE_NAME, service_config.get("rate_limit"))
+		client.batch_size = service_config.get("batch_size", 1)
+		
+		# Overwrites come last, the command line and the build file win over the config
 		if overwrites is not None:
 			attributes = overwrites.split(",")
 			for att_line in attributes:
 				att = att_line.split("=")
 				client.set_property_by_name(att[0], att[1])
 		
-		client.set_property_by_name("apply_eq", enhancement)		
-		
 		return client
 
 	except Exception as e:
@@ -125,25 +249,221 @@ def init_tts_client(service, config, overwrites, enhancement):
 		sys.exit(1)
 
 
-def main(csv_file, service, soundpack_dir, overwrites, enhancement):
-	print(f"Welcome to Jasper {JASPER_VERSION}")
-	print("Just Another Sound Pack genERator")
-	tts_client = init_tts_client(service, load_config(), overwrites, enhancement)
-	read_csv_file_and_create_audio(csv_file, OUTPUT_DIRECTORY, soundpack_dir, tts_client)
+def finish_soundpack(soundpack_dir, manifest, output_directory=OUTPUT_DIRECTORY):
+	for relative_path in manifest.remove_orphans():
+		print(f"Removed orphaned file {relative_path}")
+	remove_partial_files(f"{output_directory}{os.sep}{soundpack_dir}")
+	manifest.save()
+	
 	#Add disclaimer.txt to sound pack folder
-	with open(f"{OUTPUT_DIRECTORY}{os.sep}{soundpack_dir}{os.sep}disclaimer.txt", "w") as file:
+	with open(f"{output_directory}{os.sep}{soundpack_dir}{os.sep}disclaimer.txt", "w") as file:
 		file.write("The voices in this sound pack are AI-generated.")
 
+def remove_partial_files(soundpack_path):
+	# Left behind by builds that were killed while writing a file
+	for root, _, files in os.walk(soundpack_path):
+		for file_name in files:
+			if file_name.endswith(TEMP_FILE_SUFFIX):
+				os.remove(os.path.join(root, file_name))
+				print(f"Removed partially written file {os.path.join(root, file_name)}")
+
+def load_build_file(build_file):
+	try:
+		with open(build_file, "r") as file:
+			build = yaml.safe_load(file)
+	except yaml.YAMLError as error:
+		print(f"Error parsing YAML build file: {error}")
+		sys.exit(1)
+	except FileNotFoundError:
+		print(f"Build file {build_file} missing. Copy & edit build_example.yaml")
+		sys.exit(1)
+	
+	for key in ["name", "soundlists", "voices"]:
+		if not build or not build.get(key):
+			print(f"Build file {build_file} is missing '{key}'")
+			sys.exit(1)
+	for voice in build["voices"]:
+		if "name" not in voice or voice.get("service") not in SERVICES:
+			print(f"Every voice in {build_file} needs a name and one of the services {', '.join(SERVICES)}")
+			sys.exit(1)
+	if len(build["voices"]) > 1 and VOICE_NAME_PLACEHOLDER not in build["name"]:
+		print(f"The sound pack name in {build_file} needs a {VOICE_NAME_PLACEHOLDER} placeholder for several voices")
+		sys.exit(1)
+	return build
+
+def create_soundpacks(builds, config, options):
+	# builds is a list of (tts_client, {soundpack_dir: [csv_files]}), every voice has its own client.
+	# With a shard (i, N) only the rows of that shard are built, into <soundpack_dir>.shard-<i>-of-<N>
+	tracer = options.tracer
+	shard = options.shard
+	cache = init_tts_cache(config) if options.use_cache else None
+	# The latencies of earlier runs are kept next to the cache, also when the cache is not used
+	cache_directory = (config.get("cache") or {}).get("directory", CACHE_DIR)
+	cost_model = CostModel(f"{cache_directory}{os.sep}{LATENCY_FILE}")
+	pipeline = SynthesisPipeline(options.jobs, options.workers, tracer=tracer, cost_model=cost_model)
+	
+	soundlists = {}
+	tasks = {}
+	manifests = {}
+	for tts_client, soundpacks in builds:
+		tts_client.cache = cache
+		tts_client.tracer = tracer
+		# Learns the latency of the requests for the order of the next ones
+		tts_client.cost_model = cost_model
+		for soundpack_dir, csv_files in soundpacks.items():
+			if soundpack_dir in manifests:
+				print(f"Sound pack {soundpack_dir} would be created twice, check the sound pack names")
+				sys.exit(1)
+			# Each soundlist is only parsed once, no matter how many voices use it
+			if tuple(csv_files) not in soundlists:
+				with span(tracer, "read", files=csv_files):
+					soundlists[tuple(csv_files)] = merge_soundlists(csv_files)
+			
+			rows = soundlists[tuple(csv_files)]
+			if shard is not None:
+				shard_info = get_shard_info(rows, shard)
+				rows = filter_rows(rows, shard)
+				soundpack_dir = get_shard_directory(soundpack_dir, shard)
+			
+			manifest = BuildManifest(f"{options.output_directory}{os.sep}{soundpack_dir}", resume=options.resume)
+			if shard is not None:
+				manifest.shard = shard_info
+			skipped_count = add_synthesis_tasks(tasks, rows, tts_client, manifest, options.force)
+			print(f"{soundpack_dir}: {len(csv_files)} soundlist(s), skipped {skipped_count} unchanged files")
+			manifests[soundpack_dir] = manifest
+	
+	# All voices share one pipeline, their requests run side by side across the provider clients
+	try:
+		create_audio_files(list(tasks.values()), pipeline)
+	finally:
+		cost_model.save()
+	for soundpack_dir, manifest in manifests.items():
+		finish_soundpack(soundpack_dir, manifest, options.output_directory)
+
+def merge_soundpacks(soundpack_names, output_directory=OUTPUT_DIRECTORY):
+	# Combines the shards of sharded builds, without names every sharded sound pack in the output directory
+	sharded_soundpacks = find_sharded_soundpacks(output_directory)
+	soundpack_names = soundpack_names or list(sharded_soundpacks)
+	if not soundpack_names:
+		print(f"No sharded sound packs found in {output_directory}")
+		sys.exit(1)
+	
+	failed = False
+	for soundpack_dir in soundpack_names:
+		shard_directories = sharded_soundpacks.get(soundpack_dir)
+		if shard_directories is None:
+			print(f"No shards of {soundpack_dir} found in {output_directory}")
+			failed = True
+			continue
+		
+		files, problems = verify_shards(output_directory, shard_directories)
+		if problems:
+			print(f"{soundpack_dir}: Can't merge {len(shard_directories)} shard(s):")
+			for problem in problems:
+				print(f"  {problem}")
+			failed = True
+			continue
+		
+		manifest = BuildManifest(f"{output_directory}{os.sep}{soundpack_dir}")
+		merge_shards(files, manifest)
+		finish_soundpack(soundpack_dir, manifest, output_directory)
+		print(f"{soundpack_dir}: Merged {len(files)} files from {len(shard_directories)} shards")
+	
+	if failed:
+		sys.exit(1)
+
+def main(soundlist_patterns, service, soundpack_name, overwrites, enhancement, options):
+	config = load_config()
+	soundpacks = get_soundpacks(find_soundlists(soundlist_patterns), soundpack_name)
+	
+	# One client, cache and pipeline for all sound packs, startup and authentication happen once
+	tts_client = init_tts_client(service, config, overwrites, enhancement, init_voice_catalog(config))
+	validate_voice(tts_client)
+	create_soundpacks([(tts_client, soundpacks)], config, options)
+
+def main_matrix(build_file, options):
+	config = load_config()
+	build = load_build_file(build_file)
+	csv_files = find_soundlists(build["soundlists"])
+	
+	builds = []
+	rate_limiters = {}
+	voice_catalog = init_voice_catalog(config)
+	for voice in build["voices"]:
+		enhancement = bool(voice.get("enhancement", build.get("enhancement", False)))
+		tts_client = init_tts_client(voice["service"], config, voice.get("overwrites"), enhancement, voice_catalog)
+		validate_voice(tts_client)
+		# Voices of the same service share the account's quota
+		tts_client.rate_limiter = rate_limiters.setdefault(voice["service"], tts_client.rate_limiter)
+		
+		soundpack_name = build["name"].replace(VOICE_NAME_PLACEHOLDER, voice["name"])
+		builds.append((tts_client, get_soundpacks(csv_files, soundpack_name)))
+	
+	create_soundpacks(builds, config, options)
+
 
 if __name__ == "__main__":
 	# Instantiate the parser
 	parser = argparse.ArgumentParser(description="Generates sound files for OpenTX/Ethos/etc radios with TTS from various services")
-	parser.add_argument("-s", "--service", choices=["google", "elevenlabs", "amazon", "microsoft", "ibm"], type=str, help="Use 'google', 'amazon', 'microsoft', 'elevenlabs' or 'ibm'", required=True)
-	parser.add_argument("-f", "--file", type=str, help="CSV File to read from", required=True)
-	parser.add_argument("-n", "--name", type=str, help="Name of the Soundpack", required=True)
+	parser.add_argument("-s", "--service", choices=SERVICES, type=str, help="Use 'google', 'amazon', 'microsoft', 'elevenlabs', 'ibm' or 'mock' (offline test audio)")
+	parser.add_argument("-f", "--file", type=str, nargs="+", help="CSV File(s), directories or glob patterns to read from, rows of several files are combined into one sound pack")
+	parser.add_argument("-n", "--name", type=str, help="Name of the Soundpack, use {name} to create one sound pack per CSV file named after it")
+	parser.add_argument("-m", "--matrix", type=str, help="Build file with voices and soundlists, builds every combination in one run (replaces -s, -f, -n, -o and -e)")
 	parser.add_argument("-o", "--overwrites", type=str, help="Overwrite settings from config: pitch=4,language=de-DE")
 	parser.add_argument("-e", "--enhancement", help="Apply audio enhancement to output file (reduce lows/bass, boost highs/treble)", action="store_true")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of synthesis requests to run at the same time (Default: 1)")
+	parser.add_argument("-w", "--workers", type=int, help="Number of processes converting the synthesized audio (Default: number of CPUs)")
+	parser.add_argument("--no-cache", help="Always request audio from the TTS service, don't read or write the synthesis cache", action="store_true")
+	parser.add_argument("--force", help="Regenerate every file, even if the build manifest shows it is up to date", action="store_true")
+	parser.add_argument("--resume", help="Continue an interrupted build, the files it finished are not generated again", action="store_true")
+	parser.add_argument("--output-dir", type=str, default=OUTPUT_DIRECTORY, help=f"Directory the sound packs are written to, e.g. a shared directory for sharded builds (Default: {OUTPUT_DIRECTORY})")
+	parser.add_argument("--shard", type=str, help="Build only shard i of N, e.g. 2/4. The rows are split by a stable hash of their path, every machine builds one shard")
+	parser.add_argument("--merge", type=str, nargs="*", help="Merge and verify the shards of the given sound packs, or of every sharded sound pack in the output directory")
+	parser.add_argument("--trace", type=str, help="Save the timing of every stage per row: a Chrome trace for files ending in .json, JSON lines otherwise")
+	parser.add_argument("--profile", type=str, nargs="?", const="jasper-profile.txt", help="Run with cProfile and tracemalloc and save a summary (Default: jasper-profile.txt)")
 	args = parser.parse_args()
 	
-	main(args.file, args.service, args.name, args.overwrites, args.enhancement)
+	if args.merge is None and args.matrix is None and (args.service is None or args.file is None or args.name is None):
+		parser.error("the following arguments are required: -s/--service, -f/--file, -n/--name (or -m/--matrix)")
+	try:
+		shard = parse_shard(args.shard) if args.shard is not None else None
+	except ValueError as error:
+		parser.error(str(error))
+	if args.jobs < 1:
+		parser.error("--jobs must be at least 1")
+	if args.workers is not None and args.workers < 1:
+		parser.error("--workers must be at least 1")
+	
+	print(f"Welcome to Jasper {JASPER_VERSION}")
+	print("Just Another Sound Pack genERator")
+	if args.merge is not None:
+		merge_soundpacks(args.merge, args.output_dir)
+		sys.exit(0)
+	
+	tracer = Tracer() if args.trace is not None else None
+	options = BuildOptions(
+		jobs = 				args.jobs,
+		workers = 			args.workers,
+		use_cache = 		not args.no_cache,
+		force = 			args.force,
+		resume = 			args.resume,
+		tracer = 			tracer,
+		output_directory = 	args.output_dir,
+		shard = 			shard
+	)
+	if args.matrix is not None:
+		build = functools.partial(main_matrix, args.matrix, options)
+	else:
+		build = functools.partial(main, args.file, args.service, args.name, args.overwrites, args.enhancement, options)
+	
+	try:
+		if args.profile is not None:
+			profile_run(args.profile, build)
+		else:
+			build()
+	finally:
+		# Also saved for failed runs, the trace shows how far they got
+		if tracer is not None:
+			tracer.print_summary()
+			tracer.save(args.trace)
 	sys.exit(0)
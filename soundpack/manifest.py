@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import threading
+
+from ttsproviders.atomicfile import write_json
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+JOURNAL_FILE = "journal.jsonl"
+
+
+# Records what was generated for every file of a sound pack: the source CSV row, the synthesis
+# parameters and a hash of the written audio. A later build compares its rows against the
+# previous manifest to skip files whose inputs did not change and to find orphaned files.
+# The manifest is only saved at the end of a build, until then every added file is also appended
+# to a journal and fsynced. A build that resumes an interrupted one reads the journal as well and
+# skips the files that were finished, once the manifest is saved the journal is removed.
+class BuildManifest:
+	def __init__(self, soundpack_path, file_name=MANIFEST_FILE, resume=False):
+		self._soundpack_path = soundpack_path
+		self._manifest_path = f"{soundpack_path}{os.sep}{file_name}"
+		self._journal_path = f"{soundpack_path}{os.sep}{JOURNAL_FILE}"
+		self._journal = None
+		self._lock = threading.Lock()
+		self._previous_entries = self._load()
+		self._resumed_entries = self._load_journal() if resume else {}
+		self._previous_entries.update(self._resumed_entries)
+		self._entries = {}
+		self._shard = None
+
+		if not resume and os.path.isfile(self._journal_path):
+			print(f"Discarding the journal of an interrupted build in {soundpack_path}, use --resume to continue it")
+			os.remove(self._journal_path)
+
+	@property
+	def manifest_path(self):
+		return self._manifest_path
+
+	@property
+	def entries(self):
+		return self._entries
+
+	@property
+	def previous_entries(self):
+		return self._previous_entries
+
+	@property
+	def resumed_entries(self):
+		# Files finished by the interrupted build that is resumed
+		return self._resumed_entries
+
+	@property
+	def shard(self):
+		return self._shard
+
+	@shard.setter
+	def shard(self, value):
+		# Shard info of a sharded build, see soundpack.shards
+		self._shard = value
+
+	@staticmethod
+	def get_file_hash(file_path):
+		file_hash = hashlib.sha256()
+		with open(file_path, "rb") as file:
+			for chunk in iter(lambda: file.read(65536), b""):
+				file_hash.update(chunk)
+		return file_hash.hexdigest()
+
+	def get_file_path(self, relative_path):
+		return os.path.join(self._soundpack_path, *relative_path.split("/"))
+
+	def is_unchanged(self, relative_path, text, synthesis):
+		previous = self._previous_entries.get(relative_path)
+		if previous is None:
+			return False
+		if previous["source"]["text"] != text or previous["synthesis"] != synthesis:
+			return False
+
+		# The inputs match, but only trust the file if it is still the one we wrote
+		file_path = self.get_file_path(relative_path)
+		if not os.path.isfile(file_path):
+			return False
+		return self.get_file_hash(file_path) == previous["audio_sha256"]
+
+	def keep(self, relative_path, source):
+		with self._lock:
+			entry = dict(self._previous_entries[relative_path])
+			entry["source"] = source
+			self._entries[relative_path] = entry
+
+	def add(self, relative_path, source, synthesis, audio_hash):
+		# audio_hash is the sha256 of the written file, the writer already has its data in memory
+		entry = {
+			"source": source,
+			"synthesis": synthesis,
+			"audio_sha256": audio_hash
+		}
+		with self._lock:
+			self._entries[relative_path] = entry
+			self._append_journal(relative_path, entry)
+
+	def put(self, relative_path, entry):
+		# Takes over an entry of another manifest, e.g. when merging the shards of a build
+		with self._lock:
+			self._entries[relative_path] = dict(entry)
+
+	def remove_orphans(self):
+		removed_files = []
+		for relative_path in self._previous_entries:
+			if relative_path in self._entries:
+				continue
+			file_path = self.get_file_path(relative_path)
+			if os.path.isfile(file_path):
+				os.remove(file_path)
+				removed_files.append(relative_path)
+		return removed_files
+
+	def save(self):
+		manifest = {
+			"version": MANIFEST_VERSION,
+			"files": dict(sorted(self._entries.items()))
+		}
+		if self._shard is not None:
+			manifest["shard"] = self._shard
+		# Replace the manifest in one step, a build killed while saving keeps the old one and the journal
+		write_json(self._manifest_path, manifest, sync=True)
+
+		with self._lock:
+			if self._journal is not None:
+				self._journal.close()
+				self._journal = None
+		if os.path.isfile(self._journal_path):
+			os.remove(self._journal_path)
+
+	def _append_journal(self, relative_path, entry):
+		# One JSON line per finished file, on disk before the next file is written. The journal is
+		# handled as bytes, a build killed in the middle of a multi-byte character cuts a line anywhere.
+		if self._journal is None:
+			os.makedirs(self._soundpack_path, exist_ok=True)
+			self._journal = open(self._journal_path, "a+b")
+			# Don't continue a line that was cut off when the interrupted build was killed
+			if self._journal.seek(0, os.SEEK_END) > 0:
+				self._journal.seek(-1, os.SEEK_END)
+				if self._journal.read(1) != b"\n":
+					self._journal.write(b"\n")
+		record = json.dumps({"file": relative_path, "entry": entry}, ensure_ascii=False)
+		self._journal.write(record.encode("utf-8") + b"\n")
+		self._journal.flush()
+		os.fsync(self._journal.fileno())
+
+	def _load_journal(self):
+		entries = {}
+		try:
+			with open(self._journal_path, "rb") as file:
+				lines = file.read().split(b"\n")
+		except FileNotFoundError:
+			return {}
+		for line in lines:
+			try:
+				record = json.loads(line.decode("utf-8"))
+				entries[record["file"]] = record["entry"]
+			except (UnicodeDecodeError, json.JSONDecodeError):
+				# The last line is cut off if the build was killed while writing it
+				continue
+		if entries:
+			print(f"Resuming the interrupted build in {self._soundpack_path}: {len(entries)} files were finished")
+		return entries
+
+	def _load(self):
+		try:
+			with open(self._manifest_path, "r", encoding="utf-8") as file:
+				manifest = json.load(file)
+		except FileNotFoundError:
+			return {}
+		except json.JSONDecodeError as error:
+			print(f"Ignoring unreadable build manifest {self._manifest_path}: {error}")
+			return {}
+
+		if manifest.get("version") != MANIFEST_VERSION:
+			print(f"Ignoring build manifest {self._manifest_path} with unsupported version")
+			return {}
+		return manifest.get("files", {})
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ttsproviders.atomicfile import write_file
+from ttsproviders.tracing import span
+
+from .scheduler import order_by_cost
+
+
+# One phrase to synthesize and the files the processed audio is written to
+class SynthesisTask:
+	def __init__(self, tts_client, text, file_paths, context=None):
+		self.tts_client = tts_client
+		self.text = text
+		self.file_paths = file_paths
+		self.context = context
+
+
+# Runs soundlist rows through three stages with bounded hand-offs in between:
+#   1. synthesis: one asyncio event loop keeping up to synthesis_jobs provider requests in flight
+#   2. processing: a process pool running the DSP chain (CPU bound)
+#   3. writing: a single thread writing the finished WAV files
+# With a cost model the requests start longest first instead of in soundlist order, so the run
+# doesn't end with a few slow requests while the other slots are idle.
+# Short phrases of providers with a batch_size above 1 share one request, the clips are split
+# before processing and go through the same DSP chain as single phrases.
+# A synthesis task reserves a processing slot for every phrase before its request starts. Slots
+# are only freed once the file is written, so at most max_pending clips are synthesized and not
+# yet written: a slow disk or busy CPUs throttle the provider requests instead of piling up audio
+# in memory. The provider on the other hand never blocks the processing of audio that already
+# arrived.
+class SynthesisPipeline:
+	def __init__(self, synthesis_jobs=1, processing_workers=None, max_pending=None, tracer=None, cost_model=None):
+		self._synthesis_jobs = synthesis_jobs
+		self._processing_workers = processing_workers or os.cpu_count() or 1
+		self._max_pending = max_pending or 2 * self._processing_workers
+		self._tracer = tracer
+		self._cost_model = cost_model
+
+	def run(self, tasks, on_file_written=None):
+		# numpy and the audio libraries are only loaded once there is audio to process
+		from ttsproviders import audioprocessing
+		self._process_audio = audioprocessing.process_audio
+		self._write_queue = queue.Queue()
+		self._failed = threading.Event()
+		self._error = None
+		self._error_lock = threading.Lock()
+		self._on_file_written = on_file_written
+
+		# Let the providers open their connections before the first request is timed
+		for tts_client in {id(task.tts_client): task.tts_client for task in tasks}.values():
+			tts_client.prepare(self._synthesis_jobs)
+
+		writer = threading.Thread(target=self._write_files, name="jasper-writer")
+		writer.start()
+		try:
+			with ProcessPoolExecutor(max_workers=self._processing_workers) as process_pool:
+				self._process_pool = process_pool
+				asyncio.run(self._synthesize_all(tasks))
+				# Every synthesized task is queued by now, let the writer finish the rest
+				self._write_queue.put(None)
+				writer.join()
+		finally:
+			if writer.is_alive():
+				self._write_queue.put(None)
+				writer.join()
+
+		if self._error is not None:
+			raise self._error
+
+	async def _synthesize_all(self, tasks):
+		self._loop = asyncio.get_running_loop()
+		# Providers without native asyncio support run their blocking requests in these threads
+		self._loop.set_default_executor(ThreadPoolExecutor(max_workers=self._synthesis_jobs, thread_name_prefix="jasper-synthesis"))
+		self._synthesis_slots = asyncio.Semaphore(self._synthesis_jobs)
+		batches = self._get_batches(tasks)
+		# A batch reserves one slot per phrase, the largest batch has to fit
+		self._processing_slots = asyncio.Semaphore(max([self._max_pending] + [len(batch) for batch in batches]))
+		self._reservation_lock = asyncio.Lock()
+
+		# The synthesis slots are handed out first come first served, in the order of the jobs
+		if self._cost_model is not None:
+			batches = order_by_cost(batches, self._cost_model)
+		pending = [asyncio.create_task(self._synthesize(batch)) for batch in batches]
+		if not pending:
+			return
+		done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+		for future in done:
+			if future.exception() is not None:
+				self._fail(future.exception())
+				break
+		for future in pending:
+			future.cancel()
+		await asyncio.gather(*pending, return_exceptions=True)
+
+	@staticmethod
+	def _get_batches(tasks):
+		# Tasks of a client that batches are grouped in order, up to its batch size and character limit
+		batches = []
+		open_batches = {}
+		for task in tasks:
+			tts_client = task.tts_client
+			if not tts_client.can_batch(task.text):
+				batches.append([task])
+				continue
+			
+			batch = open_batches.get(id(tts_client))
+			if batch is None or len(batch) >= tts_client.batch_size or sum(len(t.text) for t in batch) + len(task.text) > tts_client.BATCH_MAX_CHARACTERS:
+				batch = []
+				open_batches[id(tts_client)] = batch
+				batches.append(batch)
+			batch.append(task)
+		return batches
+
+	async def _synthesize(self, batch):
+		async with self._synthesis_slots:
+			if self._failed.is_set():
+				return
+			reserved = 0
+			try:
+				# The slots of a batch are reserved in one go, two batches each holding a part of
+				# their slots would wait for each other forever
+				async with self._reservation_lock:
+					for _ in batch:
+						await self._processing_slots.acquire()
+						reserved += 1
+
+				tts_client = batch[0].tts_client
+				if len(batch) == 1:
+					results = [await tts_client.synthesize_async(batch[0].text)]
+				else:
+					results = await tts_client.synthesize_batch_async([task.text for task in batch])
+			except BaseException:
+				for _ in range(reserved):
+					self._processing_slots.release()
+				raise
+
+		for task, (audio_data, input_format) in zip(batch, results):
+			self._process(task, audio_data, input_format)
+
+	def _process(self, task, audio_data, input_format):
+		# Hands the audio to a worker process, the slot reserved for it is released by the writer
+		if audio_data is None:
+			print(f"{task.tts_client.SERVICE_NAME}: No audio received for text [{task.text}], skipping {len(task.file_paths)} file(s)")
+			self._processing_slots.release()
+			return
+		if self._failed.is_set():
+			self._processing_slots.release()
+			return
+		process_audio = self._process_audio if self._tracer is None else process_audio_traced
+		processing = self._process_pool.submit(process_audio, audio_data, input_format, task.tts_client.apply_eq)
+		self._write_queue.put((task, processing))
+
+	def _write_files(self):
+		while True:
+			item = self._write_queue.get()
+			if item is None:
+				return
+
+			task, processing = item
+			try:
+				if self._failed.is_set():
+					processing.cancel()
+					continue
+
+				wav_data = processing.result()
+				if self._tracer is not None:
+					wav_data, timings, pid, tid = wav_data
+					for name, start, end in timings:
+						self._tracer.add(name, start, end, {"text": task.text}, pid, tid, "processing")
+				
+				# Hashed once for all files of the phrase, the manifest records it for every file
+				audio_sha256 = hashlib.sha256(wav_data).hexdigest()
+				for file_path in task.file_paths:
+					with span(self._tracer, "write", file=file_path):
+						# A killed build never leaves a truncated file under the final name. The rename
+						# is not fsynced, a resumed build checks the files against the journal hashes.
+						write_file(file_path, wav_data)
+					print(f"Audio file saved: {file_path}")
+					if self._on_file_written is not None:
+						self._on_file_written(task, file_path, audio_sha256)
+			except Exception as error:
+				self._fail(error)
+			finally:
+				self._release_processing_slot()
+
+	def _release_processing_slot(self):
+		try:
+			self._loop.call_soon_threadsafe(self._processing_slots.release)
+		except RuntimeError:
+			# The event loop is closed, the synthesis stage is done and nobody waits for a slot
+			pass
+
+	def _fail(self, error):
+		# Keep the first error, later ones are usually a consequence of it
+		with self._error_lock:
+			if self._error is None:
+				self._error = error
+		self._failed.set()
+
+
+def process_audio_traced(audio_data, input_format, apply_eq):
+	# Runs in a worker process, the stage timings are sent back with the audio
+	from ttsproviders import audioprocessing
+	timings = []
+	wav_data = audioprocessing.process_audio(audio_data, input_format, apply_eq, timings)
+	return wav_data, timings, os.getpid(), threading.get_ident()
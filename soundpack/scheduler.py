@@ -0,0 +1,110 @@
+import json
+import re
+import threading
+
+from ttsproviders.atomicfile import write_json
+
+LATENCY_FILE = "latency.json"
+LATENCY_VERSION = 1
+# Starting point for services without measurements yet: a fixed part per request and a part per character
+DEFAULT_REQUEST_LATENCY = 0.3
+DEFAULT_CHARACTER_LATENCY = 0.005
+# An SSML tag costs about as much as this many spoken characters
+SSML_TAG_CHARACTERS = 10
+# Measurements of earlier runs count less with every run, so the model follows a changing service
+HISTORY_DECAY = 0.5
+MIN_SAMPLES = 5
+
+SSML_TAG = re.compile(r"<[^>]+>")
+
+
+# Estimates how long a synthesis request takes, so the longest ones can be started first and the
+# short ones fill the gaps at the end of a run. The latency of every service is a line over the
+# size of the request (spoken characters plus a weight per SSML tag), fitted with least squares
+# to the requests of the previous runs and stored as running sums in the cache directory. The
+# providers add the time of every request attempt that succeeded, without rate limiter waits.
+class CostModel:
+	def __init__(self, file_path=None):
+		self._file_path = file_path
+		self._lock = threading.Lock()
+		self._services = self._load()
+
+	@property
+	def file_path(self):
+		return self._file_path
+
+	@staticmethod
+	def get_size(text):
+		tag_count = len(SSML_TAG.findall(text))
+		return len(SSML_TAG.sub("", text).strip()) + SSML_TAG_CHARACTERS * tag_count
+
+	def get_latency(self, service_name):
+		# (seconds per request, seconds per character) of a service
+		with self._lock:
+			sums = self._services.get(service_name)
+		if sums is None or sums["n"] < MIN_SAMPLES:
+			return DEFAULT_REQUEST_LATENCY, DEFAULT_CHARACTER_LATENCY
+
+		n, sx, sy, sxx, sxy = sums["n"], sums["sx"], sums["sy"], sums["sxx"], sums["sxy"]
+		variance = n * sxx - sx * sx
+		slope = (n * sxy - sx * sy) / variance if variance > 1e-9 else DEFAULT_CHARACTER_LATENCY
+		slope = max(0.0, slope)
+		intercept = max(0.0, (sy - slope * sx) / n)
+		return intercept, slope
+
+	def estimate(self, service_name, texts):
+		# One request for all texts, as in a batch
+		request_latency, character_latency = self.get_latency(service_name)
+		return request_latency + character_latency * sum(self.get_size(text) for text in texts)
+
+	def add(self, service_name, texts, duration):
+		size = sum(self.get_size(text) for text in texts)
+		with self._lock:
+			sums = self._services.setdefault(service_name, {"n": 0.0, "sx": 0.0, "sy": 0.0, "sxx": 0.0, "sxy": 0.0})
+			sums["n"] += 1
+			sums["sx"] += size
+			sums["sy"] += duration
+			sums["sxx"] += size * size
+			sums["sxy"] += size * duration
+
+	def save(self):
+		if self._file_path is None:
+			return
+		with self._lock:
+			data = {"version": LATENCY_VERSION, "services": self._services}
+			# An interrupted save must not lose the history
+			write_json(self._file_path, data)
+
+	def _load(self):
+		if self._file_path is None:
+			return {}
+		try:
+			with open(self._file_path, "r", encoding="utf-8") as file:
+				data = json.load(file)
+		except FileNotFoundError:
+			return {}
+		except json.JSONDecodeError as error:
+			print(f"Ignoring unreadable latency history {self._file_path}: {error}")
+			return {}
+		if data.get("version") != LATENCY_VERSION:
+			return {}
+
+		services = data.get("services", {})
+		for sums in services.values():
+			for name in sums:
+				sums[name] *= HISTORY_DECAY
+		return services
+
+
+def order_by_cost(batches, cost_model):
+	# Longest job first: batches sorted by their estimated request time, phrases that are already
+	# cached need no request and go last
+	jobs = []
+	for batch in batches:
+		tts_client = batch[0].tts_client
+		texts = [task.text for task in batch if not tts_client.is_cached(task.text)]
+		cost = cost_model.estimate(tts_client.SERVICE_NAME, texts) if texts else 0.0
+		jobs.append((cost, batch))
+	# sorted is stable, jobs with the same cost keep the soundlist order
+	jobs.sort(key=lambda job: job[0], reverse=True)
+	return [batch for _, batch in jobs]
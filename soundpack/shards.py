@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from .manifest import MANIFEST_FILE, MANIFEST_VERSION, BuildManifest
+
+SHARD_DIRECTORY = re.compile(r"^(?P<name>.+)\.shard-(?P<index>\d+)-of-(?P<count>\d+)$")
+
+
+# Sharded builds split the rows of every sound pack across several machines without any
+# coordination: a row belongs to the shard picked by a stable hash of its path inside the sound
+# pack. Each shard writes a complete sound pack of its rows to <name>.shard-<i>-of-<n>, the
+# manifest records which shard it is and a digest of all rows of the sound pack. Merging checks
+# the shards against each other before copying them into one sound pack.
+
+def parse_shard(value):
+	# "i/N" with 1 <= i <= N -> (i, N)
+	index, _, count = value.partition("/")
+	try:
+		index, count = int(index), int(count)
+	except ValueError:
+		raise ValueError(f"Shard '{value}' must be given as i/N, e.g. 1/4") from None
+	if not 1 <= index <= count:
+		raise ValueError(f"Shard '{value}' must satisfy 1 <= i <= N")
+	return index, count
+
+def get_shard_index(relative_path, count):
+	# Python's hash() is salted per process, sha256 gives the same shard on every machine
+	path_hash = hashlib.sha256(relative_path.encode("utf-8")).digest()
+	return int.from_bytes(path_hash[:8], "big") % count + 1
+
+def get_shard_directory(soundpack_dir, shard):
+	index, count = shard
+	return f"{soundpack_dir}.shard-{index}-of-{count}"
+
+def get_shard_info(rows, shard):
+	# Stored in the manifest of every shard, all shards of a build have the same paths digest
+	relative_paths = sorted(row.relative_path for row in rows)
+	return {
+		"index": shard[0],
+		"count": shard[1],
+		"path_count": len(relative_paths),
+		"paths_sha256": get_paths_digest(relative_paths)
+	}
+
+def get_paths_digest(relative_paths):
+	return hashlib.sha256("\n".join(sorted(relative_paths)).encode("utf-8")).hexdigest()
+
+def filter_rows(rows, shard):
+	index, count = shard
+	return [row for row in rows if get_shard_index(row.relative_path, count) == index]
+
+def find_sharded_soundpacks(output_directory):
+	# {soundpack_dir: [shard directory names]} of every sharded sound pack in the output directory
+	soundpacks = {}
+	if not os.path.isdir(output_directory):
+		return soundpacks
+	for directory in sorted(os.listdir(output_directory)):
+		match = SHARD_DIRECTORY.match(directory)
+		if match and os.path.isdir(os.path.join(output_directory, directory)):
+			soundpacks.setdefault(match.group("name"), []).append(directory)
+	return soundpacks
+
+def get_file_path(shard_path, relative_path):
+	return os.path.join(shard_path, *relative_path.split("/"))
+
+def load_shard(shard_path):
+	try:
+		with open(os.path.join(shard_path, MANIFEST_FILE), "r", encoding="utf-8") as file:
+			manifest = json.load(file)
+	except (FileNotFoundError, json.JSONDecodeError) as error:
+		return None, f"{shard_path}: No readable manifest ({error})"
+	if manifest.get("version") != MANIFEST_VERSION or not manifest.get("shard"):
+		return None, f"{shard_path}: Not the manifest of a sharded build"
+	return manifest, None
+
+def verify_shards(output_directory, shard_directories):
+	# Returns (files, problems): files maps each relative path to (shard path, manifest entry),
+	# problems lists everything that keeps the shards from forming one complete sound pack
+	problems = []
+	shards = {}
+	for directory in shard_directories:
+		shard_path = os.path.join(output_directory, directory)
+		manifest, problem = load_shard(shard_path)
+		if problem is not None:
+			problems.append(problem)
+			continue
+		shards[shard_path] = manifest
+	if not shards:
+		return {}, problems
+
+	infos = [manifest["shard"] for manifest in shards.values()]
+	if len({(info["count"], info["path_count"], info["paths_sha256"]) for info in infos}) > 1:
+		problems.append("The shards come from different builds (shard count or soundlist rows differ), rebuild them with the same settings")
+		return {}, problems
+
+	count = infos[0]["count"]
+	indices = [info["index"] for info in infos]
+	for index in range(1, count + 1):
+		if indices.count(index) == 0:
+			problems.append(f"Shard {index}/{count} is missing")
+		elif indices.count(index) > 1:
+			problems.append(f"Shard {index}/{count} exists more than once")
+
+	files = {}
+	for shard_path, manifest in shards.items():
+		index = manifest["shard"]["index"]
+		for relative_path, entry in manifest["files"].items():
+			if get_shard_index(relative_path, count) != index:
+				problems.append(f"{shard_path}: {relative_path} belongs to shard {get_shard_index(relative_path, count)}/{count}")
+			if relative_path in files:
+				problems.append(f"{relative_path} is in {files[relative_path][0]} and {shard_path}")
+				continue
+			file_path = get_file_path(shard_path, relative_path)
+			if not os.path.isfile(file_path):
+				problems.append(f"{shard_path}: {relative_path} is missing")
+			elif BuildManifest.get_file_hash(file_path) != entry["audio_sha256"]:
+				problems.append(f"{shard_path}: {relative_path} doesn't match its manifest entry")
+			files[relative_path] = (shard_path, entry)
+
+	# Every row of the soundlists has to be in exactly one shard
+	if len(files) != infos[0]["path_count"] or get_paths_digest(files) != infos[0]["paths_sha256"]:
+		problems.append(f"The shards contain {len(files)} of {infos[0]['path_count']} files, some rows were not synthesized")
+	return files, problems
+
+def merge_shards(files, manifest):
+	# Copies the verified shard files into the sound pack of manifest and records them there
+	for relative_path, (shard_path, entry) in files.items():
+		target_path = manifest.get_file_path(relative_path)
+		os.makedirs(os.path.dirname(target_path), exist_ok=True)
+		shutil.copyfile(get_file_path(shard_path, relative_path), target_path)
+		manifest.put(relative_path, entry)
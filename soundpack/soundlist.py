@@ -0,0 +1,51 @@
+import csv
+import os
+
+
+class SoundlistRow:
+	def __init__(self, csv_file, line, file_dir, file_name, text):
+		self.csv_file = csv_file
+		self.line = line
+		self.file_dir = file_dir
+		self.file_name = file_name
+		self.text = text
+
+	@property
+	def relative_path(self):
+		# Path inside the sound pack, always with forward slashes as used in the manifest
+		return f"{self.file_dir}/{self.file_name}".replace(os.sep, "/")
+
+	@property
+	def source(self):
+		return {"file": self.csv_file, "line": self.line, "text": self.text}
+
+
+def read_soundlist(csv_file):
+	rows = []
+	with open(csv_file, "r") as csv_content:
+		dialect = csv.Sniffer().sniff(csv_content.read(), delimiters=";,")
+		csv_content.seek(0)
+		csv_reader = csv.reader(csv_content, dialect=dialect)
+		for row in csv_reader:
+			file_dir = row[0]
+			file_name = row[1]
+			text = row[2]
+
+			if text is None or text == "":
+				print(f"Empty text for {file_name}. Skipping entry..")
+				continue
+
+			rows.append(SoundlistRow(csv_file, csv_reader.line_num, file_dir, file_name, text))
+	return rows
+
+def merge_soundlists(csv_files):
+	# Later soundlists replace rows of earlier ones with the same output path,
+	# the same as writing them one after another would
+	rows = {}
+	for csv_file in csv_files:
+		for row in read_soundlist(csv_file):
+			previous = rows.get(row.relative_path)
+			if previous is not None and previous.text != row.text:
+				print(f"{row.csv_file}:{row.line} replaces {previous.csv_file}:{previous.line} for {row.relative_path}")
+			rows[row.relative_path] = row
+	return list(rows.values())
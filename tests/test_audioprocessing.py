@@ -0,0 +1,94 @@
+import io
+import math
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from ttsproviders import audioprocessing
+from ttsproviders.audioprocessing import EQ_BANDS, HIGH_PASS_FREQUENCY, LEADING_SILENCE, NORMALIZE_HEADROOM_DB, OUTPUT_SAMPLE_RATE, SILENCE_WINDOW, TRAILING_SILENCE
+
+RATE = OUTPUT_SAMPLE_RATE
+# The slowest pole of the 100 Hz band hasn't fully decayed after FILTER_PADDING, the wrapped tail
+# stays about a hundred times below one step of the 16 bit output
+FILTER_TOLERANCE = 1e-6
+
+
+def get_tone(duration, frequency=440.0, amplitude=0.5, sample_rate=RATE):
+	t = np.arange(int(duration * sample_rate)) / sample_rate
+	return amplitude * np.sin(2 * math.pi * frequency * t)
+
+def get_clip(leading, tone, trailing, sample_rate=RATE):
+	return np.concatenate((np.zeros(int(leading * sample_rate)), get_tone(tone, sample_rate=sample_rate), np.zeros(int(trailing * sample_rate))))
+
+def filter_directly(samples, b_coefficients, a_coefficients):
+	# Plain recursion of a[0] * y[n] = sum(b[k] * x[n - k]) - sum(a[k] * y[n - k]), zero initial state
+	output = np.zeros(len(samples))
+	for n in range(len(samples)):
+		value = sum(b * samples[n - k] for k, b in enumerate(b_coefficients) if n - k >= 0)
+		value -= sum(a * output[n - k] for k, a in enumerate(a_coefficients) if k > 0 and n - k >= 0)
+		output[n] = value / a_coefficients[0]
+	return output
+
+def get_peak_frequency(samples, sample_rate):
+	spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+	return np.argmax(spectrum) * sample_rate / len(samples)
+
+
+def test_trim_keeps_leading_and_trailing_silence():
+	samples = get_clip(0.5, 0.3, 0.6)
+	trimmed = audioprocessing.trim_silence(samples, RATE)
+
+	# The trim points may be off by one silence detection window
+	tolerance = SILENCE_WINDOW * RATE
+	assert abs(len(trimmed) - (LEADING_SILENCE + 0.3 + TRAILING_SILENCE) * RATE) <= tolerance
+	leading = np.flatnonzero(trimmed)[0]
+	trailing = len(trimmed) - 1 - np.flatnonzero(trimmed)[-1]
+	assert abs(leading - LEADING_SILENCE * RATE) <= tolerance
+	assert abs(trailing - TRAILING_SILENCE * RATE) <= tolerance
+
+def test_trim_of_silence_is_empty():
+	assert len(audioprocessing.trim_silence(np.zeros(RATE), RATE)) == 0
+
+def test_normalize_leaves_headroom():
+	samples = audioprocessing.normalize(get_tone(0.2, amplitude=0.1), NORMALIZE_HEADROOM_DB)
+	assert 20 * math.log10(np.max(np.abs(samples))) == pytest.approx(-NORMALIZE_HEADROOM_DB, abs=1e-9)
+
+@pytest.mark.parametrize("apply_eq", [False, True])
+def test_processed_clip_peaks_at_headroom(apply_eq):
+	buffer = io.BytesIO()
+	sf.write(buffer, get_clip(0.3, 0.5, 0.3, 24000) * 0.3, 24000, format="WAV", subtype="PCM_16")
+	wav_data = audioprocessing.process_audio(buffer.getvalue(), "wav", apply_eq)
+
+	samples, sample_rate = sf.read(io.BytesIO(wav_data))
+	assert sample_rate == OUTPUT_SAMPLE_RATE
+	# 16 bit quantization moves the peak by less than 0.01 dB
+	assert 20 * math.log10(np.max(np.abs(samples))) == pytest.approx(-NORMALIZE_HEADROOM_DB, abs=0.01)
+
+@pytest.mark.parametrize("sample_rate", [16000, 22050, 24000, 44100, 48000])
+def test_resample_keeps_length_and_frequency(sample_rate):
+	samples = get_tone(0.73, frequency=1000.0, sample_rate=sample_rate)
+	resampled = audioprocessing.resample(samples, sample_rate, RATE)
+
+	assert len(resampled) == round(len(samples) * RATE / sample_rate)
+	assert get_peak_frequency(resampled, RATE) == pytest.approx(1000.0, abs=RATE / len(resampled))
+	assert np.max(np.abs(resampled[100:-100])) == pytest.approx(0.5, abs=0.01)
+
+def test_fft_filters_match_direct_recursion():
+	samples = np.random.default_rng(1).uniform(-0.5, 0.5, 3000)
+	filters = audioprocessing.get_equalizer_filters(RATE, EQ_BANDS) + [audioprocessing.get_high_pass_filter(RATE, HIGH_PASS_FREQUENCY)]
+
+	expected = samples
+	for b_coefficients, a_coefficients in filters:
+		expected = filter_directly(expected, b_coefficients, a_coefficients)
+	assert np.allclose(audioprocessing.apply_iir_filters(samples, RATE, filters), expected, atol=FILTER_TOLERANCE)
+
+def test_equalizer_and_high_pass_use_their_filters():
+	samples = np.random.default_rng(2).uniform(-0.5, 0.5, 2000)
+	b_coefficients, a_coefficients = audioprocessing.get_high_pass_filter(RATE, HIGH_PASS_FREQUENCY)
+	assert np.allclose(audioprocessing.apply_high_pass(samples, RATE, HIGH_PASS_FREQUENCY), filter_directly(samples, b_coefficients, a_coefficients), atol=FILTER_TOLERANCE)
+
+	expected = samples
+	for b_coefficients, a_coefficients in audioprocessing.get_equalizer_filters(RATE, EQ_BANDS):
+		expected = filter_directly(expected, b_coefficients, a_coefficients)
+	assert np.allclose(audioprocessing.apply_equalizer(samples, RATE, EQ_BANDS), expected, atol=FILTER_TOLERANCE)
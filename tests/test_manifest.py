@@ -0,0 +1,31 @@
+import json
+
+from soundpack.manifest import JOURNAL_FILE, BuildManifest
+
+
+def add_entry(manifest, relative_path, text):
+	manifest.add(relative_path, {"text": text}, {"voice": "mock-low"}, "0" * 64)
+
+
+def test_resume_after_a_line_cut_in_a_multibyte_character(tmp_path):
+	manifest = BuildManifest(str(tmp_path))
+	add_entry(manifest, "altitude.wav", "Höhe")
+	add_entry(manifest, "height.wav", "Höhe")
+
+	# A build killed while writing the second line, after the first byte of the "ö"
+	journal_path = tmp_path / JOURNAL_FILE
+	journal_data = journal_path.read_bytes()
+	journal_path.write_bytes(journal_data[:journal_data.rindex("ö".encode("utf-8")) + 1])
+
+	manifest = BuildManifest(str(tmp_path), resume=True)
+	assert list(manifest.resumed_entries) == ["altitude.wav"]
+	assert manifest.resumed_entries["altitude.wav"]["source"]["text"] == "Höhe"
+
+	# The next entry starts on a new line instead of continuing the cut one
+	add_entry(manifest, "height.wav", "Höhe")
+	lines = journal_path.read_bytes().split(b"\n")
+	assert lines[-1] == b""
+	assert json.loads(lines[-2].decode("utf-8"))["file"] == "height.wav"
+
+	manifest = BuildManifest(str(tmp_path), resume=True)
+	assert sorted(manifest.resumed_entries) == ["altitude.wav", "height.wav"]
@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+
+from soundpack.pipeline import SynthesisPipeline, SynthesisTask
+from ttsproviders.mocktts import MockTTS
+
+
+# Counts the clips that were synthesized and not yet written
+class CountingMockTTS(MockTTS):
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.lock = threading.Lock()
+		self.pending = 0
+		self.max_pending = 0
+
+	async def _synthesize_async(self, text):
+		result = await super()._synthesize_async(text)
+		with self.lock:
+			self.pending += text.count("<break") + 1
+			self.max_pending = max(self.max_pending, self.pending)
+		return result
+
+	def on_file_written(self, task, file_path, audio_sha256):
+		# A slow disk: the writer falls behind the provider
+		time.sleep(0.01)
+		with self.lock:
+			self.pending -= 1
+
+
+@pytest.mark.parametrize("batch_size, max_pending", [(1, 2), (3, 2), (2, 4)])
+def test_pending_clips_are_capped(tmp_path, batch_size, max_pending):
+	tts_client = CountingMockTTS()
+	tts_client.batch_size = batch_size
+	tasks = [SynthesisTask(tts_client, f"Phrase number {index}", [str(tmp_path / f"{index}.wav")]) for index in range(40)]
+
+	pipeline = SynthesisPipeline(synthesis_jobs=8, processing_workers=2, max_pending=max_pending)
+	pipeline.run(tasks, tts_client.on_file_written)
+
+	assert tts_client.pending == 0
+	assert len(list(tmp_path.iterdir())) == len(tasks)
+	# A batch reserves a slot for each of its phrases, a larger batch raises the cap to its size
+	assert 0 < tts_client.max_pending <= max(max_pending, batch_size)
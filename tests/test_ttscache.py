@@ -0,0 +1,40 @@
+import os
+
+from ttsproviders.ttscache import CACHE_LOW_WATERMARK, TTSCache
+
+
+def put_entries(cache, count):
+	keys = [cache.get_key("Test", {}, f"Phrase {index}") for index in range(count)]
+	for index, key in enumerate(keys):
+		cache.put(key, b"x" * 10, "wav")
+		# The mtimes carry the LRU order to the next run
+		file_path = cache._get_file_path(key, "wav")
+		os.utime(file_path, (1000 + index, 1000 + index))
+	return keys
+
+
+def test_evicts_least_recently_used_down_to_low_watermark(tmp_path):
+	cache = TTSCache(str(tmp_path), max_size=100)
+	keys = put_entries(cache, 10)
+	assert cache.get(keys[0]) == (b"x" * 10, "wav")
+
+	cache.put(cache.get_key("Test", {}, "Phrase 10"), b"x" * 10, "wav")
+	assert cache.size <= 100 * CACHE_LOW_WATERMARK
+	assert not cache.contains(keys[1]) and not cache.contains(keys[2])
+	assert cache.contains(keys[0])
+
+
+def test_restores_lru_order_from_mtimes(tmp_path):
+	keys = put_entries(TTSCache(str(tmp_path)), 5)
+	os.utime(TTSCache(str(tmp_path))._get_file_path(keys[0], "wav"), (2000, 2000))
+
+	cache = TTSCache(str(tmp_path), max_size=30)
+	assert [key for key in keys if cache.contains(key)] == [keys[0], keys[4]]
+
+
+def test_missing_file_is_a_miss(tmp_path):
+	cache = TTSCache(str(tmp_path))
+	keys = put_entries(cache, 1)
+	os.remove(cache._get_file_path(keys[0], "wav"))
+	assert cache.get(keys[0]) is None
+	assert not cache.contains(keys[0]) and cache.size == 0
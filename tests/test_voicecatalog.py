@@ -0,0 +1,42 @@
+import time
+
+from ttsproviders.mocktts import MockTTS
+from ttsproviders.voicecatalog import VoiceCatalog
+
+
+def get_client(tmp_path, voice_id):
+	catalog = VoiceCatalog(str(tmp_path))
+	tts_client = MockTTS(voice_id=voice_id)
+	tts_client.voice_catalog = catalog
+	return tts_client, catalog
+
+
+def test_missing_voice_reloads_the_saved_list(tmp_path):
+	tts_client, catalog = get_client(tmp_path, "mock-high")
+	# A list saved before mock-high existed, still within the ttl
+	entry = catalog.refresh(tts_client)
+	entry["voices"] = [voice for voice in entry["voices"] if voice["id"] != "mock-high"]
+	catalog._save(catalog._get_key(tts_client), entry)
+
+	tts_client, catalog = get_client(tmp_path, "mock-high")
+	assert tts_client.validate_voice()
+	# The reloaded list is saved for the next run
+	assert any(voice["id"] == "mock-high" for voice in catalog._load(catalog._get_key(tts_client))["voices"])
+
+
+def test_unknown_voice_fails_after_one_reload(tmp_path, monkeypatch):
+	tts_client, catalog = get_client(tmp_path, "mock-low")
+	catalog.refresh(tts_client)
+	requests = []
+	original_list_voices = tts_client.list_voices
+
+	def list_voices():
+		requests.append(time.time())
+		return [voice for voice in original_list_voices() if voice["id"] != "mock-low"]
+
+	monkeypatch.setattr(tts_client, "list_voices", list_voices)
+	catalog.refresh(tts_client)
+	requests.clear()
+
+	assert not tts_client.validate_voice()
+	assert len(requests) == 1
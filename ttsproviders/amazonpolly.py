@@ -1,19 +1,30 @@
-import io
-
 import boto3
-import sounddevice as sd
-import soundfile as sf
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError
 
 from .ttsprovider import TTSProvider
 
+# Polly streams raw PCM only at 8 or 16 kHz
+STREAM_SAMPLE_RATE = 16000
+STREAM_CHUNK_SIZE = 4096
+# Sample rates per output format, the standard engine has no 24 kHz mp3
+OUTPUT_SAMPLE_RATES = {
+	"mp3": [8000, 16000, 22050, 24000],
+	"pcm": [8000, 16000]
+}
+THROTTLING_ERROR_CODES = ["ThrottlingException", "Throttling", "TooManyRequestsException"]
+TRANSIENT_ERROR_CODES = ["ServiceFailureException", "ServiceUnavailable", "InternalFailure"]
+
 
 class AmazonPollyTTS(TTSProvider):
 	SERVICE_NAME = "Amazon Polly TTS"
+	SUPPORTS_BATCHING = True
 
 	def __init__(self, aws_access_key_id, aws_secret_access_key, region_name="eu-central-1", language="en-GB", engine="neural", voice_id="Kimberly"):
 		self._language = language
 		self._voice_id = voice_id
 		self._engine = engine
+		self._region_name = region_name
+		self._output_format = self.negotiate_output_format()
 		
 		session = boto3.Session(aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key, region_name=region_name)
 		self._client = session.client('polly')
@@ -40,22 +51,6 @@ class AmazonPollyTTS(TTSProvider):
 			raise TypeError("Voice id/name must be a string")
 		self._voice_id = name
 	
-	def play_text(self, text):
-		print(f"{self.SERVICE_NAME}: Playing Text..")
-		
-		response = self._generate_tts_output(text)
-		
-		with io.BytesIO(response["AudioStream"].read()) as file:
-			data, samplerate = sf.read(file)			
-			sd.play(data, samplerate=samplerate, blocking=True)
-	
-	def save_file(self, text, file_path):
-		print(f"{self.SERVICE_NAME}: Saving file..")
-		
-		response = self._generate_tts_output(text)
-
-		TTSProvider.save_and_convert_file(response.get('AudioStream').read(), "mp3", file_path, apply_eq=self._apply_eq)
-	
 	def get_voices(self):
 		voices = []
 		
@@ -65,26 +60,78 @@ class AmazonPollyTTS(TTSProvider):
 			voices.append(v)
 		
 		while response.get("NextToken") is not None:
-			response = self._client.describe_voices(Engine=self._engine)
+			response = self._client.describe_voices(Engine=self._engine, NextToken=response.get("NextToken"))
 
 			for v in response.get("Voices"):
 				voices.append(v)
 		
 		return voices
+	
+	def _normalize_voice(self, voice):
+		return {
+			"id": voice.get("Id"),
+			"name": voice.get("Name"),
+			"language": voice.get("LanguageCode"),
+			"gender": voice.get("Gender")
+		}
+	
+	def get_catalog_region(self):
+		# The voice list depends on the region and the engine
+		return f"{self._region_name}-{self._engine}"
+	
+	def get_output_formats(self):
+		output_formats = []
+		for format_name, sample_rates in OUTPUT_SAMPLE_RATES.items():
+			for sample_rate in sample_rates:
+				if not (self._engine == "standard" and sample_rate > 22050):
+					output_formats.append((format_name, sample_rate))
+		return output_formats
+	
+	def get_voice_properties(self):
+		return {
+			"language": self._language,
+			"voice_id": self._voice_id,
+			"engine": self._engine
+		}
+	
+	def is_throttling_error(self, error):
+		if isinstance(error, ClientError):
+			return error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+		return super().is_throttling_error(error)
+	
+	def is_retryable_error(self, error):
+		if isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES:
+			return True
+		return isinstance(error, BotoConnectionError) or super().is_retryable_error(error)
+	
+	def _synthesize(self, text):
+		# Negotiated on setup, pcm only goes up to 16 kHz so this is the highest mp3 rate of the engine
+		format_name, sample_rate = self._output_format
+		response = self._generate_tts_output(text, output_format=format_name, sample_rate=sample_rate)
+		return response.get("AudioStream").read(), f"pcm:{sample_rate}" if format_name == "pcm" else format_name
+	
+	def _synthesize_stream(self, text):
+		# The AudioStream is read while Polly is still sending it
+		response = self._generate_tts_output(text, output_format="pcm", sample_rate=STREAM_SAMPLE_RATE)
+		return response.get("AudioStream").iter_chunks(STREAM_CHUNK_SIZE), f"pcm:{STREAM_SAMPLE_RATE}"
 		
-	def _generate_tts_output(self, text):
+	def _generate_tts_output(self, text, output_format="mp3", sample_rate=None):
 		if text.startswith("<speak"):
 			request_type = "ssml"
 		else:
 			request_type = "text"
 		
-		response = self._client.synthesize_speech(
-			Engine=self._engine,
-			LanguageCode=self._language,
-			OutputFormat='mp3',
-			Text=text,
-			TextType=request_type,
-			VoiceId=self._voice_id
-		)
+		request = {
+			"Engine": self._engine,
+			"LanguageCode": self._language,
+			"OutputFormat": output_format,
+			"Text": text,
+			"TextType": request_type,
+			"VoiceId": self._voice_id
+		}
+		if sample_rate is not None:
+			request["SampleRate"] = str(sample_rate)
+		
+		response = self._client.synthesize_speech(**request)
 		
 		return response
@@ -0,0 +1,36 @@
+import json
+import os
+import tempfile
+
+# Temp files are named tmp<random>.part next to the file they replace
+TEMP_FILE_SUFFIX = ".part"
+
+
+# Files that are read while they may be rewritten (the cache, the voice catalogs, manifests and
+# sound pack files) are written to a temp file in the same directory first and renamed over the
+# target in one step: a reader or a killed process sees the old or the new file, never a partial
+# one. sync also flushes the data to disk before the rename, for files a crash must not lose.
+def write_file(file_path, data, sync=False):
+	directory = os.path.dirname(file_path) or "."
+	os.makedirs(directory, exist_ok=True)
+	temp_fd, temp_path = tempfile.mkstemp(dir=directory, suffix=TEMP_FILE_SUFFIX)
+	try:
+		if isinstance(data, str):
+			file = os.fdopen(temp_fd, "w", encoding="utf-8")
+		else:
+			file = os.fdopen(temp_fd, "wb")
+		with file:
+			file.write(data)
+			if sync:
+				file.flush()
+				os.fsync(file.fileno())
+		os.replace(temp_path, file_path)
+	except BaseException:
+		try:
+			os.remove(temp_path)
+		except FileNotFoundError:
+			pass
+		raise
+
+def write_json(file_path, data, sync=False):
+	write_file(file_path, json.dumps(data, indent=2, ensure_ascii=False), sync)
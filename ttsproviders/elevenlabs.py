@@ -1,18 +1,22 @@
-from elevenlabs import (Voice, VoiceSettings, generate, play, set_api_key,
-                        voices)
+import requests
+from elevenlabs import Voice, VoiceSettings, generate, set_api_key, voices
 
 from .ttsprovider import TTSProvider
 
+MODEL = "eleven_multilingual_v2"
+
 
 class ElevenLabsTTS(TTSProvider):
 	SERVICE_NAME = "ElevenLabs TTS"
 
-	def __init__(self, api_key=None, voice_id="", stability=None, similarity=None, style=None, speaker_boost=None):
+	def __init__(self, api_key=None, voice_id="", stability=None, similarity=None, style=None, speaker_boost=None, voice_catalog=None):
 		if api_key is not None:
 			set_api_key(api_key)
 		
+		# Set before the voice, the default settings of a voice come from the catalog
+		self._voice_catalog = voice_catalog
 		self._voice_id = voice_id
-		self._voice_settings = VoiceSettings.from_voice_id(self._voice_id)
+		self._voice_settings = self._load_voice_settings(self._voice_id)
 		
 		if stability is not None and isinstance(stability, float):
 			self._voice_settings.stability = stability
@@ -28,6 +32,18 @@ class ElevenLabsTTS(TTSProvider):
 		
 		print(f"{self.SERVICE_NAME} setup: Voice ID: {self._voice_id}")
 	
+	def __copy__(self):
+		# The voice settings are changed in place, a copy needs its own settings object
+		clone = self.__class__.__new__(self.__class__)
+		clone.__dict__.update(self.__dict__)
+		clone._voice_settings = VoiceSettings(
+			stability=self._voice_settings.stability,
+			similarity_boost=self._voice_settings.similarity_boost,
+			style=self._voice_settings.style,
+			use_speaker_boost=self._voice_settings.use_speaker_boost
+		)
+		return clone
+	
 	@property
 	def voice_id(self):
 		return self._voice_id
@@ -37,7 +53,7 @@ class ElevenLabsTTS(TTSProvider):
 		if not isinstance(voice, str):
 			raise TypeError("Voice id/name must be a string")
 		self._voice_id = voice
-		self._voice_settings = VoiceSettings.from_voice_id(self._voice_id)
+		self._voice_settings = self._load_voice_settings(self._voice_id)
 	
 	@property
 	def stability(self):
@@ -97,18 +113,52 @@ class ElevenLabsTTS(TTSProvider):
 			raise TypeError("speaker_boost must be boolean") from e
 		
 	
-	def play_text(self, text):
-		print(f"{self.SERVICE_NAME}: Playing Text..")
-		play(self._generate_tts_output(text))
-	
-	def save_file(self, text, file_path):
-		print(f"{self.SERVICE_NAME}: Saving file..")
-		TTSProvider.save_and_convert_file(self._generate_tts_output(text), "mp3", file_path, apply_eq=self._apply_eq)
-		print(f"{self.SERVICE_NAME}: Audio content written to file {file_path}")
-	
 	def get_voices(self):
 		return voices()
 	
+	def _normalize_voice(self, voice):
+		labels = voice.labels or {}
+		return {
+			"id": voice.voice_id,
+			"name": voice.name,
+			"language": labels.get("language", ""),
+			"gender": labels.get("gender", "")
+		}
+	
+	def get_output_formats(self):
+		# generate() of the pinned SDK has no output format option
+		return [("mp3", 44100)]
+	
+	def get_default_voice_settings(self, voice_id):
+		settings = VoiceSettings.from_voice_id(voice_id)
+		return {
+			"stability": settings.stability,
+			"similarity_boost": settings.similarity_boost,
+			"style": settings.style,
+			"use_speaker_boost": settings.use_speaker_boost
+		}
+	
+	def get_voice_properties(self):
+		return {
+			"voice_id": self._voice_id,
+			"stability": self._voice_settings.stability,
+			"similarity": self._voice_settings.similarity_boost,
+			"style": self._voice_settings.style,
+			"speaker_boost": self._voice_settings.use_speaker_boost,
+			"model": MODEL
+		}
+	
+	def is_retryable_error(self, error):
+		return isinstance(error, (requests.ConnectionError, requests.Timeout)) or super().is_retryable_error(error)
+	
+	def _synthesize(self, text):
+		return self._generate_tts_output(text), "mp3"
+	
+	def _load_voice_settings(self, voice_id):
+		if self._voice_catalog is None:
+			return VoiceSettings.from_voice_id(voice_id)
+		return VoiceSettings(**self._voice_catalog.get_voice_settings(self, voice_id))
+	
 	def _generate_tts_output(self, text):
 		audio = generate(
 			text=text,
@@ -116,6 +166,6 @@ class ElevenLabsTTS(TTSProvider):
 				voice_id=self._voice_id,
 				settings=self._voice_settings
 			),
-			model="eleven_multilingual_v2",
+			model=MODEL,
 		)
 		return audio
@@ -1,7 +1,6 @@
-import io
+import asyncio
 
-import sounddevice as sd
-import soundfile as sf
+from google.api_core import exceptions as google_exceptions
 from google.cloud import texttospeech
 from google.oauth2 import service_account
 
@@ -10,6 +9,8 @@ from .ttsprovider import TTSProvider
 
 class GoogleTTS(TTSProvider):
 	SERVICE_NAME = "Google Cloud TTS"
+	SUPPORTS_BATCHING = True
+	VOICE_PROPERTY = "voice_name"
 
 	def __init__(self, credentials_file, language="en-GB", voice_name="en-GB-Neural2-A", speaking_rate=1.0, pitch=0.0, sample_rate_hertz=32000):
 		self._language = language
@@ -18,8 +19,10 @@ class GoogleTTS(TTSProvider):
 		self._pitch = pitch
 		self._sample_rate_hertz = sample_rate_hertz
 		
-		credentials = service_account.Credentials.from_service_account_file(credentials_file)
-		self._client = texttospeech.TextToSpeechClient(credentials=credentials)
+		self._credentials = service_account.Credentials.from_service_account_file(credentials_file)
+		self._client = texttospeech.TextToSpeechClient(credentials=self._credentials)
+		self._async_client = None
+		self._async_client_loop = None
 		print(f"{self.SERVICE_NAME} setup: Selected voice: {self._voice_name}")
 	
 	@property
@@ -88,30 +91,64 @@ class GoogleTTS(TTSProvider):
 		except TypeError as e:
 			raise TypeError("sample_rate_hertz value must be a valid integer") from e
 	
-	def play_text(self, text):
-		print(f"{self.SERVICE_NAME}: Playing Text..")
-		
-		response = self._generate_tts_output(text)
-		
-		with io.BytesIO(response.audio_content) as file:
-			data, samplerate = sf.read(file)			
-			sd.play(data, samplerate=samplerate, blocking=True)
-	
-	def save_file(self, text, file_path):
-		print(f"{self.SERVICE_NAME}: Saving file..")
-		
-		response = self._generate_tts_output(text)
-
-		TTSProvider.save_and_convert_file(response.audio_content, "wav", file_path, apply_eq=self._apply_eq)
-	
 	def get_voices(self):
 		request = texttospeech.ListVoicesRequest()
 
 		response = self._client.list_voices(request=request)
 		
 		return response.voices
+	
+	def _normalize_voice(self, voice):
+		return {
+			"id": voice.name,
+			"name": voice.name,
+			"language": voice.language_codes[0],
+			"gender": texttospeech.SsmlVoiceGender(voice.ssml_gender).name
+		}
+	
+	def get_output_formats(self):
+		# LINEAR16 comes back as a wav file at the configured rate, any rate the setter accepts works
+		return [("wav", self._sample_rate_hertz)]
+	
+	def get_voice_properties(self):
+		return {
+			"language": self._language,
+			"voice_name": self._voice_name,
+			"speaking_rate": self._speaking_rate,
+			"pitch": self._pitch,
+			"sample_rate_hertz": self._sample_rate_hertz
+		}
+	
+	def is_throttling_error(self, error):
+		return isinstance(error, (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)) or super().is_throttling_error(error)
+	
+	def is_retryable_error(self, error):
+		if isinstance(error, (google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded, google_exceptions.InternalServerError)):
+			return True
+		return super().is_retryable_error(error)
+	
+	def _synthesize(self, text):
+		response = self._generate_tts_output(text)
+		return response.audio_content, "wav"
+	
+	async def _synthesize_async(self, text):
+		response = await self._get_async_client().synthesize_speech(request=self._get_synthesis_request(text))
+		return response.audio_content, "wav"
+	
+	def _get_async_client(self):
+		# The grpc aio channel is bound to the event loop it was created in
+		loop = asyncio.get_running_loop()
+		if self._async_client is None or self._async_client_loop is not loop:
+			self._async_client = texttospeech.TextToSpeechAsyncClient(credentials=self._credentials)
+			self._async_client_loop = loop
+		return self._async_client
 		
 	def _generate_tts_output(self, text):
+		response = self._client.synthesize_speech(request=self._get_synthesis_request(text))
+		
+		return response
+	
+	def _get_synthesis_request(self, text):
 		if text.startswith("<speak"):
 			synthesis_input = texttospeech.SynthesisInput(ssml=text)
 		else:
@@ -128,9 +165,7 @@ class GoogleTTS(TTSProvider):
 			pitch = self._pitch,
 			sample_rate_hertz=self._sample_rate_hertz
 		)
-
-		response = self._client.synthesize_speech(
+		
+		return texttospeech.SynthesizeSpeechRequest(
 			input=synthesis_input, voice=voice, audio_config=audio_config
 		)
-		
-		return response
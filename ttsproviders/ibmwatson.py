@@ -1,20 +1,31 @@
-import io
-
-import sounddevice as sd
-import soundfile as sf
+import requests
+from ibm_cloud_sdk_core import ApiException
 from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
 from ibm_watson import TextToSpeechV1
 
+from .audioprocessing import OUTPUT_SAMPLE_RATE
 from .ttsprovider import TTSProvider
 
+TRANSIENT_STATUS_CODES = [500, 502, 503, 504]
+STREAM_CHUNK_SIZE = 4096
+# Accept headers of the lossless outputs, the service synthesizes at any sample rate
+ACCEPT_TYPES = {
+	"pcm": "audio/l16;rate={sample_rate};endianness=little-endian",
+	"wav": "audio/wav;rate={sample_rate}"
+}
+
 
 class IBMWatsonTTS(TTSProvider):
 	SERVICE_NAME = "IBM Watson TTS"
+	SUPPORTS_BATCHING = True
+	VOICE_PROPERTY = "voice_name"
 
 	def __init__(self, api_key, api_url, voice_name="en-US_MichaelV3Voice", speaking_rate=0, pitch=0):
 		self._voice_name = voice_name
 		self._speaking_rate = speaking_rate
 		self._pitch = pitch
+		self._api_url = api_url
+		self._output_format = self.negotiate_output_format()
 		
 		authenticator = IAMAuthenticator(api_key)
 		self._text_to_speech = TextToSpeechV1(
@@ -64,33 +75,64 @@ class IBMWatsonTTS(TTSProvider):
 		except TypeError as e:
 			raise TypeError("pitch value must be a valid integer") from e
 	
-	def play_text(self, text):
-		print(f"{self.SERVICE_NAME}: Playing Text..")
-		
-		response = self._generate_tts_output(text)
-		
-		with io.BytesIO(response.content) as file:
-			data, samplerate = sf.read(file)			
-			sd.play(data, samplerate=samplerate, blocking=True)
-	
-	def save_file(self, text, file_path):
-		print(f"{self.SERVICE_NAME}: Saving file..")
-		
-		response = self._generate_tts_output(text)
-
-		TTSProvider.save_and_convert_file(response.content, "wav", file_path, apply_eq=self._apply_eq)
-	
 	def get_voices(self):
 		voices = self._text_to_speech.list_voices().get_result()
 		return voices["voices"]
+	
+	def _normalize_voice(self, voice):
+		return {
+			"id": voice.get("name"),
+			"name": voice.get("description", voice.get("name")),
+			"language": voice.get("language"),
+			"gender": voice.get("gender")
+		}
+	
+	def get_output_formats(self):
+		return [(format_name, OUTPUT_SAMPLE_RATE) for format_name in ACCEPT_TYPES]
+	
+	def get_catalog_region(self):
+		# The service url contains the region of the instance
+		return self._api_url
+	
+	def get_voice_properties(self):
+		return {
+			"voice_name": self._voice_name,
+			"speaking_rate": self._speaking_rate,
+			"pitch": self._pitch
+		}
+	
+	def is_throttling_error(self, error):
+		if isinstance(error, ApiException):
+			return error.code == 429
+		return super().is_throttling_error(error)
+	
+	def is_retryable_error(self, error):
+		if isinstance(error, ApiException) and error.code in TRANSIENT_STATUS_CODES:
+			return True
+		return isinstance(error, (requests.ConnectionError, requests.Timeout)) or super().is_retryable_error(error)
+	
+	def _synthesize(self, text):
+		response = self._generate_tts_output(text)
+		return response.content, self._get_input_format()
+	
+	def _synthesize_stream(self, text):
+		# Without stream=True the SDK reads the whole body before returning the response
+		response = self._generate_tts_output(text, stream=True)
+		return response.iter_content(STREAM_CHUNK_SIZE), self._get_input_format()
+	
+	def _get_input_format(self):
+		format_name, sample_rate = self._output_format
+		return f"pcm:{sample_rate}" if format_name == "pcm" else format_name
 		
-	def _generate_tts_output(self, text):
+	def _generate_tts_output(self, text, stream=False):
 		print("Generating IBM Watson TTS Output..")
 		
+		format_name, sample_rate = self._output_format
 		return self._text_to_speech.synthesize(
 			text, 
-			accept='audio/wav;rate=32000', 
+			accept=ACCEPT_TYPES[format_name].format(sample_rate=sample_rate), 
 			voice=self._voice_name, 
 			rate_percentage=self._speaking_rate, 
-			pitch_percentage=self._pitch
+			pitch_percentage=self._pitch,
+			stream=stream
 		).get_result()
@@ -1,21 +1,53 @@
+import asyncio
+import itertools
+import queue
+from xml.sax.saxutils import escape
+
 import azure.cognitiveservices.speech as speechsdk
 
-from .ttsprovider import TTSProvider
+from . import audioprocessing
+from .ttsprovider import ThrottlingError, TTSProvider
+
+STREAM_CHUNK_SIZE = 4096
+# Raw PCM outputs of the service and their sample rates, the Riff formats add a WAV header
+PCM_OUTPUT_FORMATS = {
+	"Raw8Khz16BitMonoPcm": 8000,
+	"Raw16Khz16BitMonoPcm": 16000,
+	"Raw22050Hz16BitMonoPcm": 22050,
+	"Raw24Khz16BitMonoPcm": 24000,
+	"Raw44100Hz16BitMonoPcm": 44100,
+	"Raw48Khz16BitMonoPcm": 48000
+}
+AUTO_OUTPUT_FORMAT = "auto"
+# Audio offsets of the SDK are given in ticks of 100 ns
+TICKS_PER_SECOND = 10000000
 
 
 class MicrosoftAzureTTS(TTSProvider):
 	SERVICE_NAME = "Microsoft Azure TTS"
+	SUPPORTS_BATCHING = True
 
-	def __init__(self, speech_security_key, region_name="germanywestcentral", language="en-GB", voice_id="en-GB-LibbyNeural", speaking_rate=1.0, pitch=0, output_format="Riff48Khz16BitMonoPcm"):
+	def __init__(self, speech_security_key, region_name="germanywestcentral", language="en-GB", voice_id="en-GB-LibbyNeural", speaking_rate=1.0, pitch=0, output_format=AUTO_OUTPUT_FORMAT):
 		self._language = language
 		self._speaking_rate = speaking_rate
 		self._pitch = pitch
 		self._voice_id = voice_id
+		if output_format == AUTO_OUTPUT_FORMAT:
+			_, sample_rate = self.negotiate_output_format()
+			output_format = next(name for name, rate in PCM_OUTPUT_FORMATS.items() if rate == sample_rate)
+		self._output_format = output_format
+		self._region_name = region_name
 		
 		self._speech_config = speechsdk.SpeechConfig(subscription=speech_security_key, region=region_name)
 		self._speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat[output_format])
+		# Idle (synthesizer, connection) pairs. A synthesizer handles one request at a time, so
+		# concurrent requests each take their own and put it back afterwards. The voice and prosody
+		# are part of the SSML, the synthesizers stay valid when those change.
+		self._synthesizers = queue.SimpleQueue()
+		self._synthesizer_count = 0
+		self.prepare(1)
 		
-		print(f"{self.SERVICE_NAME} setup: Selected voice: {voice_id}")
+		print(f"{self.SERVICE_NAME} setup: Selected voice: {voice_id}, output format: {output_format}")
 	
 	@property
 	def language(self):
@@ -87,38 +119,183 @@ class MicrosoftAzureTTS(TTSProvider):
 			<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xmlns:mstts="https://www.w3.org/2001/mstts" xml:lang="{self._language}">
 				<voice name="{self._voice_id}">{text_insert}</voice>
 			</speak>"""
-			
 	
-	def play_text(self, text):
-		print(f"{self.SERVICE_NAME}: Playing Text..")
+	def _get_batch_text(self, texts):
+		# A bookmark in front of every phrase after the first one marks where its audio starts
+		phrases = [escape(texts[0])]
+		for index, text in enumerate(texts[1:], start=1):
+			phrases.append(f"""<break time="{int(self.BATCH_BREAK * 1000)}ms"/><bookmark mark="{index}"/>{escape(text)}""")
+		return self._get_ssml_text("".join(phrases))
+	
+	
+	def prepare(self, concurrency):
+		# Opens the connections of the synthesizers up front, instead of with the first requests
+		if self._rate_limiter is not None and self._rate_limiter.concurrency_limit is not None:
+			concurrency = min(concurrency, self._rate_limiter.concurrency_limit)
+		while self._synthesizer_count < concurrency:
+			self._release_synthesizer(self._create_synthesizer())
+	
+	def get_voices(self):
+		speech_synthesizer = self._acquire_synthesizer()
+		try:
+			response = speech_synthesizer[0].get_voices_async().get()
+		finally:
+			self._release_synthesizer(speech_synthesizer)
+		
+		if response.reason == speechsdk.ResultReason.VoicesListRetrieved:
+			return response.voices
+		elif response.reason == speechsdk.ResultReason.Canceled:
+			print(f"List Voices Request canceled; error details: {response.error_details}")
+			return None
+	
+	def _normalize_voice(self, voice):
+		return {
+			"id": voice.short_name,
+			"name": voice.local_name,
+			"language": voice.locale,
+			"gender": voice.gender.name
+		}
+	
+	def get_catalog_region(self):
+		return self._region_name
+	
+	def get_output_formats(self):
+		return [("pcm", sample_rate) for sample_rate in PCM_OUTPUT_FORMATS.values()]
+	
+	def get_voice_properties(self):
+		return {
+			"language": self._language,
+			"voice_id": self._voice_id,
+			"speaking_rate": self._speaking_rate,
+			"pitch": self._pitch,
+			"output_format": self._output_format
+		}
+	
+	def _synthesize(self, text):
 		ssml_text = self._get_ssml_text(text)
-		speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=self._speech_config)
-		speech_synthesizer.speak_ssml(ssml_text)
+		speech_synthesizer = self._acquire_synthesizer()
+		try:
+			result = speech_synthesizer[0].speak_ssml_async(ssml_text).get()
+		finally:
+			self._release_synthesizer(speech_synthesizer)
+		return self._get_audio_data(text, result)
 	
-	def save_file(self, text, file_path):
-		print(f"{self.SERVICE_NAME}: Saving file..")
-
+	async def _synthesize_async(self, text):
+		result = await self._speak_async(self._get_ssml_text(text))
+		return self._get_audio_data(text, result)
+	
+	async def _synthesize_batch_async(self, texts):
+		# Splits at the bookmark offsets, falls back to the breaks if some bookmarks were not reported
+		offsets = {}
+		
+		def add_offset(evt):
+			offsets[evt.text] = evt.audio_offset / TICKS_PER_SECOND
+		
+		result = await self._speak_async(self._get_batch_text(texts), on_bookmark=add_offset)
+		audio_data, input_format = self._get_audio_data(f"{len(texts)} phrases", result)
+		if audio_data is None:
+			return None
+		
+		bookmarks = [offsets.get(str(index)) for index in range(1, len(texts))]
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(None, audioprocessing.split_batch, audio_data, input_format, len(texts), self.BATCH_BREAK, None if None in bookmarks else bookmarks)
+	
+	async def _speak_async(self, ssml_text, on_bookmark=None):
+		# The SDK reports the finished request through events on its own threads,
+		# those resolve an asyncio future instead of blocking a thread on ResultFuture.get()
+		speech_synthesizer = self._acquire_synthesizer()
+		
+		loop = asyncio.get_running_loop()
+		result_future = loop.create_future()
+		
+		def set_result(evt):
+			loop.call_soon_threadsafe(lambda: result_future.done() or result_future.set_result(evt.result))
+		
+		synthesizer = speech_synthesizer[0]
+		synthesizer.synthesis_completed.connect(set_result)
+		synthesizer.synthesis_canceled.connect(set_result)
+		if on_bookmark is not None:
+			# Bookmarks are reported before the request completes
+			synthesizer.bookmark_reached.connect(on_bookmark)
+		try:
+			synthesizer.speak_ssml_async(ssml_text)
+			return await result_future
+		finally:
+			# The next request on this synthesizer must not resolve this future
+			synthesizer.synthesis_completed.disconnect_all()
+			synthesizer.synthesis_canceled.disconnect_all()
+			synthesizer.bookmark_reached.disconnect_all()
+			self._release_synthesizer(speech_synthesizer)
+	
+	def _synthesize_stream(self, text):
+		# start_speaking returns as soon as the first audio arrived, the rest is read from the stream
 		ssml_text = self._get_ssml_text(text)
-
-		speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=self._speech_config, audio_config=None)
+		speech_synthesizer = self._acquire_synthesizer()
 		
-		result = speech_synthesizer.speak_ssml_async(ssml_text).get()
-
+		result = speech_synthesizer[0].start_speaking_ssml_async(ssml_text).get()
+		if result.reason != speechsdk.ResultReason.SynthesizingAudioStarted:
+			self._release_synthesizer(speech_synthesizer)
+			self._get_audio_data(text, result)
+			return iter([]), self._get_input_format()
+		
+		audio_stream = speechsdk.AudioDataStream(result)
+		chunks = self._read_audio_stream(audio_stream, speech_synthesizer)
+		first_chunk = next(chunks, b"")
+		
+		input_format = "wav" if first_chunk.startswith(b"RIFF") else self._get_input_format()
+		return itertools.chain([first_chunk], chunks), input_format
+	
+	def _read_audio_stream(self, audio_stream, speech_synthesizer):
+		# The synthesizer is busy until the stream is read completely. A stream that is abandoned
+		# halfway (cancelled playback) may still be running, its synthesizer is not reused.
+		buffer = bytes(STREAM_CHUNK_SIZE)
+		while True:
+			size = audio_stream.read_data(buffer)
+			if size == 0:
+				self._release_synthesizer(speech_synthesizer)
+				return
+			yield buffer[:size]
+	
+	def _create_synthesizer(self):
+		speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=self._speech_config, audio_config=None)
+		# Without an open connection the SDK connects with the first request
+		connection = speechsdk.Connection.from_speech_synthesizer(speech_synthesizer)
+		connection.open(True)
+		self._synthesizer_count += 1
+		return speech_synthesizer, connection
+	
+	def _acquire_synthesizer(self):
+		try:
+			return self._synthesizers.get_nowait()
+		except queue.Empty:
+			return self._create_synthesizer()
+	
+	def _release_synthesizer(self, speech_synthesizer):
+		self._synthesizers.put(speech_synthesizer)
+	
+	def _get_audio_data(self, text, result):
 		if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
 			print(f"Speech synthesized for text [{text}]")
-			TTSProvider.save_and_convert_file(result.audio_data, "wav", file_path, apply_eq=self._apply_eq)
+			return result.audio_data, self._get_input_format()
 		elif result.reason == speechsdk.ResultReason.Canceled:
 			cancellation_details = result.cancellation_details
 			print(f"Speech synthesis canceled: {cancellation_details.reason}")
 			if cancellation_details.reason == speechsdk.CancellationReason.Error:
 				print(f"Error details: {cancellation_details.error_details}")
+				# Raise the errors a retry can fix, so the rate limiter sees them
+				error_code = cancellation_details.error_code
+				if error_code == speechsdk.CancellationErrorCode.TooManyRequests:
+					raise ThrottlingError(cancellation_details.error_details)
+				if error_code in (speechsdk.CancellationErrorCode.ConnectionFailure, speechsdk.CancellationErrorCode.ServiceUnavailable):
+					raise ConnectionError(cancellation_details.error_details)
+				if error_code == speechsdk.CancellationErrorCode.ServiceTimeout:
+					raise TimeoutError(cancellation_details.error_details)
 		
+		return None, self._get_input_format()
 	
-	def get_voices(self):
-		response = speechsdk.SpeechSynthesizer(speech_config=self._speech_config, audio_config=None).get_voices_async().get()
-		
-		if response.reason == speechsdk.ResultReason.VoicesListRetrieved:
-			return response.voices
-		elif response.reason == speechsdk.ResultReason.Canceled:
-			print(f"List Voices Request canceled; error details: {response.error_details}")
-			return None
+	def _get_input_format(self):
+		if self._output_format in PCM_OUTPUT_FORMATS:
+			return f"pcm:{PCM_OUTPUT_FORMATS[self._output_format]}"
+		if "Mp3" in self._output_format:
+			return "mp3"
+		return "wav"
@@ -0,0 +1,232 @@
+import asyncio
+import collections
+import io
+import math
+import random
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+import soundfile as sf
+
+from .ttsprovider import ThrottlingError, TTSProvider
+
+# Voices of the mock service, the factor scales the pitch of the generated "words"
+VOICES = {
+	"mock-low": 0.75,
+	"mock-mid": 1.0,
+	"mock-high": 1.4
+}
+OUTPUT_FORMATS = ["wav", "mp3"]
+LEADING_SILENCE = 0.15
+TRAILING_SILENCE = 0.2
+WORD_DURATION = 0.12
+CHARACTER_DURATION = 0.045
+WORD_GAP = 0.06
+AMPLITUDE = 0.4
+# Settings that make the mock behave like the real services: output format and typical latency
+PROVIDER_PROFILES = {
+	"google": 		{"output_format": "wav", "sample_rate": 32000, "latency": 0.25, "jitter": 0.1},
+	"elevenlabs": 	{"output_format": "mp3", "sample_rate": 44100, "latency": 0.9, "jitter": 0.4},
+	"amazon": 		{"output_format": "mp3", "sample_rate": 24000, "latency": 0.15, "jitter": 0.05},
+	"microsoft": 	{"output_format": "wav", "sample_rate": 48000, "latency": 0.3, "jitter": 0.1},
+	"ibm": 			{"output_format": "wav", "sample_rate": 32000, "latency": 0.45, "jitter": 0.15}
+}
+SSML_BREAK = re.compile(r"<break[^>]*/>")
+SSML_TAG = re.compile(r"<[^>]+>")
+
+
+# Offline stand-in for a TTS service. The audio is generated from the text, the same text and
+# voice always give the same clip: one tone burst per word between silence that gets trimmed.
+# Latency, jitter, random failures and a request quota simulate the network side, so builds and
+# benchmarks can run without an account. The seed only drives latency and failures.
+class MockTTS(TTSProvider):
+	SERVICE_NAME = "Mock TTS"
+	SUPPORTS_BATCHING = True
+
+	def __init__(self, voice_id="mock-mid", output_format="wav", sample_rate=24000, latency=0.0, character_latency=0.0, jitter=0.0, failure_rate=0.0, requests_per_second=None, seed=0):
+		self.voice_id = voice_id
+		self.output_format = output_format
+		self.sample_rate = sample_rate
+		self.latency = latency
+		self.character_latency = character_latency
+		self.jitter = jitter
+		self.failure_rate = failure_rate
+		self._requests_per_second = requests_per_second
+		self._random = random.Random(seed)
+		self._lock = threading.Lock()
+		self._request_times = collections.deque()
+
+		print(f"{self.SERVICE_NAME} setup: Selected voice: {self._voice_id}, output format: {self._output_format} {self._sample_rate} Hz")
+
+	@property
+	def voice_id(self):
+		return self._voice_id
+
+	@voice_id.setter
+	def voice_id(self, name):
+		if name not in VOICES:
+			raise ValueError(f"voice_id must be one of {', '.join(VOICES)}")
+		self._voice_id = name
+
+	@property
+	def output_format(self):
+		return self._output_format
+
+	@output_format.setter
+	def output_format(self, value):
+		if value not in OUTPUT_FORMATS:
+			raise ValueError(f"output_format must be one of {', '.join(OUTPUT_FORMATS)}")
+		self._output_format = value
+
+	@property
+	def sample_rate(self):
+		return self._sample_rate
+
+	@sample_rate.setter
+	def sample_rate(self, value):
+		try:
+			_value = int(value)
+			if 8000 <= _value <= 48000:
+				self._sample_rate = _value
+			else:
+				raise ValueError("sample_rate must be between 8000 and 48000")
+		except TypeError as e:
+			raise TypeError("sample_rate value must be a valid integer") from e
+
+	@property
+	def latency(self):
+		return self._latency
+
+	@latency.setter
+	def latency(self, value):
+		_value = float(value)
+		if _value < 0:
+			raise ValueError("latency must not be negative")
+		self._latency = _value
+
+	@property
+	def character_latency(self):
+		return self._character_latency
+
+	@character_latency.setter
+	def character_latency(self, value):
+		_value = float(value)
+		if _value < 0:
+			raise ValueError("character_latency must not be negative")
+		self._character_latency = _value
+
+	@property
+	def jitter(self):
+		return self._jitter
+
+	@jitter.setter
+	def jitter(self, value):
+		_value = float(value)
+		if _value < 0:
+			raise ValueError("jitter must not be negative")
+		self._jitter = _value
+
+	@property
+	def failure_rate(self):
+		return self._failure_rate
+
+	@failure_rate.setter
+	def failure_rate(self, value):
+		_value = float(value)
+		if not 0 <= _value < 1:
+			raise ValueError("failure_rate must be between 0 and 1")
+		self._failure_rate = _value
+
+	def get_voices(self):
+		return [{"id": voice_id, "factor": factor} for voice_id, factor in VOICES.items()]
+
+	def _normalize_voice(self, voice):
+		return {
+			"id": voice["id"],
+			"name": voice["id"],
+			"language": "en-US",
+			"gender": "NEUTRAL"
+		}
+
+	def get_output_formats(self):
+		return [(self._output_format, self._sample_rate)]
+
+	def get_voice_properties(self):
+		return {
+			"voice_id": self._voice_id,
+			"output_format": self._output_format,
+			"sample_rate": self._sample_rate
+		}
+
+	def _synthesize(self, text):
+		time.sleep(self._start_request(text))
+		return self._generate_audio(text), self._output_format
+
+	async def _synthesize_async(self, text):
+		# Waiting for the "network" doesn't block a thread, like the services with an asyncio SDK
+		await asyncio.sleep(self._start_request(text))
+		return self._generate_audio(text), self._output_format
+
+	def _start_request(self, text):
+		# Returns the latency of the request or raises the error the service would answer with
+		with self._lock:
+			now = time.monotonic()
+			if self._requests_per_second is not None:
+				while self._request_times and now - self._request_times[0] > 1.0:
+					self._request_times.popleft()
+				if len(self._request_times) >= self._requests_per_second:
+					raise ThrottlingError("429 Too Many Requests")
+				self._request_times.append(now)
+
+			if self._random.random() < self._failure_rate:
+				raise ConnectionError("Simulated connection failure")
+			latency = self._latency + self._character_latency * len(text)
+			return max(0.0, latency + self._random.uniform(-self._jitter, self._jitter))
+
+	def _generate_audio(self, text):
+		if text.startswith("<speak"):
+			# Batches: the phrases between the breaks with BATCH_BREAK seconds of silence in between
+			phrases = [SSML_TAG.sub("", phrase) for phrase in SSML_BREAK.split(text)]
+			gap = np.zeros(int(self.BATCH_BREAK * self._sample_rate))
+			parts = []
+			for phrase in phrases:
+				parts.extend([self._generate_samples(phrase), gap])
+			samples = np.concatenate(parts[:-1])
+		else:
+			samples = self._generate_samples(text)
+		return self._encode(samples)
+
+	def _generate_samples(self, text):
+		rate = self._sample_rate
+		rng = np.random.default_rng(zlib.crc32(f"{self._voice_id}:{text}".encode("utf-8")))
+		parts = [np.zeros(int(LEADING_SILENCE * rate))]
+		for word in text.split() or [text]:
+			duration = WORD_DURATION + CHARACTER_DURATION * len(word)
+			t = np.arange(int(duration * rate)) / rate
+			frequency = rng.uniform(110, 240) * VOICES[self._voice_id]
+			envelope = np.sin(math.pi * t / duration)
+			tone = np.sin(2 * math.pi * frequency * t) + 0.3 * np.sin(4 * math.pi * frequency * t)
+			parts.append(AMPLITUDE * envelope * tone / 1.3)
+			parts.append(np.zeros(int(WORD_GAP * rate)))
+		parts.append(np.zeros(int(TRAILING_SILENCE * rate)))
+		return np.concatenate(parts)
+
+	def _encode(self, samples):
+		buffer = io.BytesIO()
+		if self._output_format == "wav":
+			sf.write(buffer, samples, self._sample_rate, format="WAV", subtype="PCM_16")
+			return buffer.getvalue()
+
+		try:
+			sf.write(buffer, samples, self._sample_rate, format="MP3")
+		except (sf.LibsndfileError, ValueError, TypeError):
+			# Older libsndfile builds can't write mp3, let ffmpeg encode it
+			from pydub import AudioSegment
+			pcm_data = np.clip(np.round(samples * 32767), -32768, 32767).astype("<i2").tobytes()
+			segment = AudioSegment(pcm_data, sample_width=2, frame_rate=self._sample_rate, channels=1)
+			buffer = io.BytesIO()
+			segment.export(buffer, format="mp3")
+		return buffer.getvalue()
@@ -0,0 +1,67 @@
+import numpy as np
+import sounddevice as sd
+
+from . import audioprocessing
+
+# Audio is written to the output device in blocks of this length, cancellation is checked in between
+BLOCK_DURATION = 0.05
+
+
+def play_stream(chunks, input_format, is_cancelled=None, on_progress=None):
+	# Plays audio while it is still arriving. Raw PCM and 16 bit WAV streams start with the first
+	# chunk, other formats (mp3) have to be received completely before they can be decoded.
+	# on_progress is called with "received" once all audio arrived and "first_audio" when the
+	# playback starts. Returns the decoded (samples, sample_rate), (None, None) if nothing was
+	# received or the playback was cancelled.
+	is_cancelled = is_cancelled or (lambda: False)
+	on_progress = on_progress or (lambda event: None)
+	
+	sample_rate, channels, chunks = audioprocessing.split_pcm_stream(chunks, input_format)
+	streaming = sample_rate is not None
+	if not streaming:
+		audio_data = b"".join(chunks)
+		on_progress("received")
+		if not audio_data:
+			return None, None
+		samples, sample_rate = audioprocessing.decode_audio(audio_data, input_format)
+		channels = samples.shape[1]
+		chunks = [np.clip(np.round(samples * 32768), -32768, 32767).astype("<i2").tobytes()]
+	
+	frame_size = 2 * channels
+	block_size = max(1, int(BLOCK_DURATION * sample_rate)) * frame_size
+	received = bytearray()
+	position = 0
+	
+	with sd.RawOutputStream(samplerate=sample_rate, channels=channels, dtype="int16") as stream:
+		def play_blocks(end):
+			nonlocal position
+			while end - position >= frame_size:
+				if is_cancelled():
+					return False
+				block_end = min(end, position + block_size)
+				block_end -= (block_end - position) % frame_size
+				# Blocks while the device buffer is full, so this runs at playback speed
+				stream.write(bytes(received[position:block_end]))
+				if position == 0:
+					on_progress("first_audio")
+				position = block_end
+			return True
+		
+		for chunk in chunks:
+			received += chunk
+			# Keep the rest of a block for the next chunk, a short write would make the device underrun
+			if not play_blocks(len(received) - (len(received) - position) % block_size):
+				stream.abort()
+				return None, None
+		
+		if streaming:
+			on_progress("received")
+		if not play_blocks(len(received)):
+			stream.abort()
+			return None, None
+		stream.stop()
+	
+	if position == 0:
+		return None, None
+	samples = np.frombuffer(bytes(received[:position]), dtype="<i2")
+	return samples.reshape(-1, channels).astype(np.float64) / 32768, sample_rate
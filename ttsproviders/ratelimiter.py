@@ -0,0 +1,170 @@
+import asyncio
+import collections
+import random
+import time
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+# Several requests usually get throttled at once, only the first one within this window lowers the limits
+DECREASE_COOLDOWN = 1.0
+# The request rate is measured over this window when the service throttles
+RATE_WINDOW = 1.0
+MIN_REQUESTS_PER_SECOND = 0.5
+
+
+# Keeps the request rate of one provider account below its quota: a token bucket limits the
+# requests per second, an AIMD controller the request rate and the number of requests in flight.
+# Both grow by one per round of successful requests and are halved whenever the service throttles
+# us. Without configured limits nothing is held back until the first throttling, then the rate
+# starts at half of what the service accepted in the last second.
+# Throttled and transient failures are retried with exponential backoff and full jitter.
+class RateLimiter:
+	def __init__(self, name, requests_per_second=None, burst=None, max_concurrency=None, min_concurrency=1, max_retries=DEFAULT_MAX_RETRIES, backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX):
+		if requests_per_second is not None and requests_per_second <= 0:
+			raise ValueError("requests_per_second must be greater than 0")
+		if max_concurrency is not None and not 1 <= min_concurrency <= max_concurrency:
+			raise ValueError("concurrency limits must satisfy 1 <= min_concurrency <= max_concurrency")
+
+		self._name = name
+		self._max_rate = requests_per_second
+		self._rate = requests_per_second
+		self._burst = burst or max(1, requests_per_second or 1)
+		self._tokens = self._burst
+		self._last_refill = time.monotonic()
+		self._completed = collections.deque()
+
+		self._min_concurrency = min_concurrency
+		self._max_concurrency = max_concurrency
+		self._concurrency_limit = float(max_concurrency) if max_concurrency is not None else None
+		self._last_decrease = 0.0
+		self._in_flight = 0
+
+		self._max_retries = max_retries
+		self._backoff_base = backoff_base
+		self._backoff_max = backoff_max
+
+		self._loop = None
+		self._condition = None
+
+	@classmethod
+	def from_config(cls, name, config):
+		config = config or {}
+		return cls(
+			name,
+			requests_per_second = float(config["requests_per_second"]) if config.get("requests_per_second") else None,
+			burst = int(config["burst"]) if config.get("burst") else None,
+			max_concurrency = int(config["max_concurrency"]) if config.get("max_concurrency") else None,
+			min_concurrency = int(config.get("min_concurrency", 1)),
+			max_retries = int(config.get("max_retries", DEFAULT_MAX_RETRIES))
+		)
+
+	@property
+	def concurrency_limit(self):
+		# None while the requests in flight aren't limited
+		if self._concurrency_limit is None:
+			return None
+		return int(self._concurrency_limit)
+
+	@property
+	def requests_per_second(self):
+		return self._rate
+
+	async def run(self, request, is_throttling_error, is_retryable_error):
+		attempt = 0
+		while True:
+			await self._acquire_token()
+			await self._acquire_slot()
+			try:
+				result = await request()
+				self._increase_limits()
+				return result
+			except Exception as error:
+				throttled = is_throttling_error(error)
+				if throttled:
+					self._decrease_limits()
+				if attempt >= self._max_retries or not (throttled or is_retryable_error(error)):
+					raise
+
+				attempt += 1
+				delay = random.uniform(0, min(self._backoff_max, self._backoff_base * 2 ** attempt))
+				reason = "Throttled" if throttled else f"Request failed ({error})"
+				print(f"{self._name}: {reason}, retry {attempt}/{self._max_retries} in {delay:.1f}s ({self._get_limits_text()})")
+			finally:
+				await self._release_slot()
+			await asyncio.sleep(delay)
+
+	async def _acquire_token(self):
+		while self._rate is not None:
+			now = time.monotonic()
+			self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+			self._last_refill = now
+			if self._tokens >= 1:
+				self._tokens -= 1
+				return
+			await asyncio.sleep((1 - self._tokens) / self._rate)
+
+	async def _acquire_slot(self):
+		condition = self._get_condition()
+		async with condition:
+			await condition.wait_for(lambda: self._concurrency_limit is None or self._in_flight < self.concurrency_limit)
+			self._in_flight += 1
+
+	async def _release_slot(self):
+		self._in_flight -= 1
+		try:
+			condition = self._get_condition()
+		except RuntimeError:
+			# The event loop is shut down (Ctrl+C), nobody waits for a slot anymore
+			return
+		async with condition:
+			condition.notify_all()
+
+	def _get_condition(self):
+		# asyncio primitives belong to one event loop, every pipeline run starts a new one
+		loop = asyncio.get_running_loop()
+		if self._loop is not loop:
+			self._loop = loop
+			self._condition = asyncio.Condition()
+		return self._condition
+
+	def _get_limits_text(self):
+		limits = []
+		if self._concurrency_limit is not None:
+			limits.append(f"concurrency limit {self.concurrency_limit}")
+		if self._rate is not None:
+			limits.append(f"{self._rate:.1f} requests/s")
+		return ", ".join(limits) or "no limits"
+
+	def _increase_limits(self):
+		now = time.monotonic()
+		self._completed.append(now)
+		while now - self._completed[0] > RATE_WINDOW:
+			self._completed.popleft()
+
+		if self._concurrency_limit is not None:
+			self._concurrency_limit = self._concurrency_limit + 1 / self._concurrency_limit
+			if self._max_concurrency is not None:
+				self._concurrency_limit = min(self._max_concurrency, self._concurrency_limit)
+		if self._rate is not None:
+			self._rate = self._rate + 1 / self._rate
+			if self._max_rate is not None:
+				self._rate = min(self._max_rate, self._rate)
+
+	def _decrease_limits(self):
+		now = time.monotonic()
+		if now - self._last_decrease < DECREASE_COOLDOWN:
+			return
+		self._last_decrease = now
+
+		# Halve what was actually used, a limit far above it wouldn't slow anything down
+		in_flight = max(self._in_flight, self._min_concurrency)
+		concurrency = in_flight if self._concurrency_limit is None else min(self._concurrency_limit, in_flight)
+		self._concurrency_limit = max(self._min_concurrency, concurrency / 2)
+
+		while self._completed and now - self._completed[0] > RATE_WINDOW:
+			self._completed.popleft()
+		accepted_rate = len(self._completed) / RATE_WINDOW
+		rate = accepted_rate if self._rate is None else min(self._rate, accepted_rate)
+		self._rate = max(MIN_REQUESTS_PER_SECOND, rate / 2)
+		self._tokens = min(self._tokens, 1)
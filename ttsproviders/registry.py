@@ -0,0 +1,25 @@
+import importlib
+
+# Service name used on the command line -> (module, provider class, config section).
+# The provider SDKs take seconds to import, so a module is only loaded once its service is used.
+PROVIDERS = {
+	"google": 		("ttsproviders.googletts", "GoogleTTS", "googletts"),
+	"elevenlabs": 	("ttsproviders.elevenlabs", "ElevenLabsTTS", "elevenlabs"),
+	"amazon": 		("ttsproviders.amazonpolly", "AmazonPollyTTS", "amazonpolly"),
+	"microsoft": 	("ttsproviders.microsoftazure", "MicrosoftAzureTTS", "microsoftazure"),
+	"ibm": 			("ttsproviders.ibmwatson", "IBMWatsonTTS", "ibmwatson"),
+	"mock": 		("ttsproviders.mocktts", "MockTTS", "mocktts")
+}
+SERVICES = list(PROVIDERS)
+
+
+def get_provider_class(service):
+	if service not in PROVIDERS:
+		raise ValueError(f"Unknown service '{service}', use one of {', '.join(SERVICES)}")
+	module_name, class_name, _ = PROVIDERS[service]
+	return getattr(importlib.import_module(module_name), class_name)
+
+def get_config_section(service):
+	if service not in PROVIDERS:
+		raise ValueError(f"Unknown service '{service}', use one of {', '.join(SERVICES)}")
+	return PROVIDERS[service][2]
@@ -0,0 +1,138 @@
+import contextlib
+import io
+import json
+import os
+import threading
+import time
+
+PROFILE_STATS_COUNT = 40
+PROFILE_ALLOCATIONS_COUNT = 25
+
+
+# Collects timed spans of a build: reading the soundlists, cache lookups, provider requests,
+# decoding, DSP, encoding and writing. Spans of the worker processes are measured there and
+# added with their own pid, perf_counter is a system wide clock so they line up with the rest.
+# The spans are saved as JSON lines or, for files ending in .json, as a Chrome trace that
+# chrome://tracing or https://ui.perfetto.dev can show as a timeline.
+class Tracer:
+	def __init__(self):
+		self._origin = time.perf_counter()
+		self._lock = threading.Lock()
+		self._spans = []
+		self._threads = {}
+
+	@property
+	def spans(self):
+		return self._spans
+
+	@contextlib.contextmanager
+	def span(self, name, **args):
+		start = time.perf_counter()
+		try:
+			yield
+		except BaseException as error:
+			args["error"] = type(error).__name__
+			raise
+		finally:
+			self.add(name, start, time.perf_counter(), args)
+
+	def add(self, name, start, end, args=None, pid=None, tid=None, thread_name=None):
+		if pid is None:
+			pid = os.getpid()
+		if tid is None:
+			tid = threading.get_ident()
+			thread_name = threading.current_thread().name
+
+		with self._lock:
+			self._spans.append({
+				"name": name,
+				"start": start - self._origin,
+				"duration": end - start,
+				"pid": pid,
+				"tid": tid,
+				"args": args or {}
+			})
+			self._threads.setdefault((pid, tid), thread_name or str(tid))
+
+	def get_summary(self):
+		# {name: (count, total seconds, longest seconds)} in the order the stages first appeared
+		summary = {}
+		with self._lock:
+			for span in self._spans:
+				count, total, longest = summary.get(span["name"], (0, 0.0, 0.0))
+				summary[span["name"]] = (count + 1, total + span["duration"], max(longest, span["duration"]))
+		return summary
+
+	def print_summary(self):
+		print("Stage        Count     Total s      Mean ms       Max ms")
+		for name, (count, total, longest) in self.get_summary().items():
+			print(f"{name:<10} {count:>7} {total:>11.3f} {total / count * 1000:>12.2f} {longest * 1000:>12.2f}")
+
+	def save(self, file_path):
+		with self._lock:
+			spans = list(self._spans)
+			threads = dict(self._threads)
+
+		with open(file_path, "w", encoding="utf-8") as file:
+			if file_path.endswith(".json"):
+				json.dump({"traceEvents": self._get_trace_events(spans, threads), "displayTimeUnit": "ms"}, file)
+			else:
+				for span in spans:
+					file.write(json.dumps(dict(span, thread=threads[(span["pid"], span["tid"])]), ensure_ascii=False) + "\n")
+		print(f"Trace with {len(spans)} spans saved: {file_path}")
+
+	@staticmethod
+	def _get_trace_events(spans, threads):
+		# Complete events ("X") with microsecond timestamps, plus the thread names as metadata
+		events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}} for (pid, tid), name in threads.items()]
+		for span in spans:
+			events.append({
+				"name": span["name"],
+				"cat": "jasper",
+				"ph": "X",
+				"ts": round(span["start"] * 1000000, 1),
+				"dur": round(span["duration"] * 1000000, 1),
+				"pid": span["pid"],
+				"tid": span["tid"],
+				"args": span["args"]
+			})
+		return events
+
+
+def span(tracer, name, **args):
+	# Tracing is optional, without a tracer the code runs untimed
+	if tracer is None:
+		return contextlib.nullcontext()
+	return tracer.span(name, **args)
+
+def profile_run(file_path, function, *args):
+	# Runs function with cProfile and tracemalloc, writes the raw stats to <file_path>.prof and a
+	# summary of the slowest functions and largest allocations to file_path. cProfile only sees the
+	# main thread with the event loop of the synthesis stage, use a trace for the other stages.
+	import cProfile
+	import pstats
+	import tracemalloc
+	
+	profiler = cProfile.Profile()
+	tracemalloc.start()
+	profiler.enable()
+	try:
+		return function(*args)
+	finally:
+		profiler.disable()
+		snapshot = tracemalloc.take_snapshot()
+		current_memory, peak_memory = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+		stats_file_path = f"{os.path.splitext(file_path)[0]}.prof"
+		profiler.dump_stats(stats_file_path)
+		summary = io.StringIO()
+		summary.write(f"Traced memory: {current_memory / (1024 * 1024):.1f} MB at the end, {peak_memory / (1024 * 1024):.1f} MB peak\n\n")
+		summary.write("Largest allocations by line:\n")
+		for statistic in snapshot.statistics("lineno")[:PROFILE_ALLOCATIONS_COUNT]:
+			summary.write(f"  {statistic}\n")
+		summary.write("\n")
+		pstats.Stats(profiler, stream=summary).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_STATS_COUNT)
+		with open(file_path, "w", encoding="utf-8") as file:
+			file.write(summary.getvalue())
+		print(f"Profile saved: {file_path} (raw stats: {stats_file_path})")
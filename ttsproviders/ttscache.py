@@ -0,0 +1,131 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+
+from .atomicfile import write_file
+
+CACHE_DIR = "cache"
+CACHE_MAX_SIZE = 500 * 1024 * 1024
+# Eviction frees space down to this share of max_size, so the next puts don't evict again right away
+CACHE_LOW_WATERMARK = 0.9
+
+
+# Persistent store of synthesized provider output. Entries are addressed by a hash over the
+# service name, the voice properties and the text, so a changed voice setting never returns
+# stale audio. The least recently used entries are removed once max_size bytes are exceeded.
+# The entries are kept in LRU order in memory, file mtimes only carry the order to the next run.
+class TTSCache:
+	def __init__(self, directory=CACHE_DIR, max_size=CACHE_MAX_SIZE):
+		self._directory = directory
+		self._max_size = max_size
+		self._lock = threading.Lock()
+		# key -> (file_path, input_format, size), least recently used first
+		self._entries = collections.OrderedDict()
+		self._size = 0
+
+		os.makedirs(self._directory, exist_ok=True)
+		self._load_index()
+
+	@property
+	def directory(self):
+		return self._directory
+
+	@property
+	def max_size(self):
+		return self._max_size
+
+	@property
+	def size(self):
+		return self._size
+
+	@staticmethod
+	def get_key(service_name, properties, text):
+		key_data = json.dumps({"service": service_name, "properties": properties, "text": text}, sort_keys=True)
+		return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+	def contains(self, key):
+		with self._lock:
+			return key in self._entries
+
+	def get(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return None
+			self._entries.move_to_end(key)
+
+		# Read without the lock, other threads keep using the cache meanwhile
+		file_path, input_format, _ = entry
+		try:
+			with open(file_path, "rb") as file:
+				audio_data = file.read()
+			# The mtime keeps the LRU order for the next run
+			os.utime(file_path)
+		except FileNotFoundError:
+			with self._lock:
+				# Evicted or deleted by hand, unless it was written again in the meantime
+				if self._entries.get(key) == entry:
+					self._remove_entry(key)
+			return None
+
+		return audio_data, input_format
+
+	def put(self, key, audio_data, input_format):
+		file_path = self._get_file_path(key, input_format)
+		# A concurrent reader must never see a partial entry
+		write_file(file_path, audio_data)
+
+		with self._lock:
+			if key in self._entries:
+				self._size -= self._entries[key][2]
+			self._entries[key] = (file_path, input_format, len(audio_data))
+			self._entries.move_to_end(key)
+			self._size += len(audio_data)
+			self._evict()
+
+	def clear(self):
+		with self._lock:
+			for key in list(self._entries):
+				self._remove_entry(key)
+
+	def _get_file_path(self, key, input_format):
+		# "pcm:<rate>" can't be part of a file name on Windows, the extension uses pcm_<rate>
+		return f"{self._directory}{os.sep}{key[:2]}{os.sep}{key}.{input_format.replace(':', '_')}"
+
+	def _load_index(self):
+		# The LRU order of the last run is restored from the mtimes, oldest first
+		files = []
+		for root, _, file_names in os.walk(self._directory):
+			for file_name in file_names:
+				key, _, input_format = file_name.partition(".")
+				if len(key) != 64 or input_format == "":
+					continue
+				file_path = os.path.join(root, file_name)
+				try:
+					stat = os.stat(file_path)
+				except FileNotFoundError:
+					continue
+				files.append((stat.st_mtime, key, file_path, input_format.replace("_", ":"), stat.st_size))
+
+		with self._lock:
+			for _, key, file_path, input_format, file_size in sorted(files):
+				self._entries[key] = (file_path, input_format, file_size)
+				self._size += file_size
+			self._evict()
+
+	def _evict(self):
+		if self._size <= self._max_size:
+			return
+
+		while self._entries and self._size > self._max_size * CACHE_LOW_WATERMARK:
+			self._remove_entry(next(iter(self._entries)))
+
+	def _remove_entry(self, key):
+		file_path, _, file_size = self._entries.pop(key)
+		self._size -= file_size
+		try:
+			os.remove(file_path)
+		except FileNotFoundError:
+			pass
@@ -1,25 +1,52 @@
-import os
+import asyncio
+import time
 from abc import ABC, abstractmethod
+from xml.sax.saxutils import escape
 
-from pydub import AudioSegment
+from . import audioprocessing
+from .tracing import span
 
-TEMP_DIR = "temp"
+# Lower case fragments of error messages that mean the service throttled a request
+THROTTLING_MARKERS = ["429", "too many requests", "throttl", "rate limit", "too_many_concurrent_requests"]
+
+
+class ThrottlingError(Exception):
+	pass
 
 
 class TTSProvider(ABC):
 	SERVICE_NAME = "TTS Service"
+	# Key of the selected voice in get_voice_properties()
+	VOICE_PROPERTY = "voice_id"
+	# Services that take SSML can synthesize several phrases in one request, separated by breaks
+	SUPPORTS_BATCHING = False
+	BATCH_BREAK = 1.0
+	BATCH_MAX_CHARACTERS = 1500
 	_apply_eq = False
+	_batch_size = 1
+	_cache = None
+	_cost_model = None
+	_rate_limiter = None
+	_tracer = None
+	_voice_catalog = None
 
 	@abstractmethod
-	def play_text(self, text):
+	def get_voices(self):
 		pass
-
+	
 	@abstractmethod
-	def save_file(self, text, file_path, apply_eq=False):
+	def _normalize_voice(self, voice):
+		# Converts one entry of get_voices() to {"id", "name", "language", "gender"}
 		pass
 	
 	@abstractmethod
-	def get_voices(self):
+	def get_voice_properties(self):
+		# Everything besides the text that changes the synthesized audio
+		pass
+	
+	@abstractmethod
+	def _synthesize(self, text):
+		# Returns (audio_data, input_format), audio_data is None if the service returned no audio
 		pass
 
 	@property
@@ -34,47 +61,246 @@ class TTSProvider(ABC):
 		except TypeError as e:
 			raise TypeError("apply_eq must be boolean") from e
 
+	@property
+	def batch_size(self):
+		return self._batch_size
+	
+	@batch_size.setter
+	def batch_size(self, value):
+		try:
+			_value = int(value)
+			if _value >= 1:
+				self._batch_size = _value
+			else:
+				raise ValueError("batch_size must be at least 1")
+		except TypeError as e:
+			raise TypeError("batch_size value must be a valid integer") from e
+
+	@property
+	def cache(self):
+		return self._cache
+	
+	@cache.setter
+	def cache(self, value):
+		self._cache = value
+
+	@property
+	def rate_limiter(self):
+		return self._rate_limiter
+	
+	@rate_limiter.setter
+	def rate_limiter(self, value):
+		self._rate_limiter = value
+
+	@property
+	def cost_model(self):
+		return self._cost_model
+	
+	@cost_model.setter
+	def cost_model(self, value):
+		self._cost_model = value
+
+	@property
+	def tracer(self):
+		return self._tracer
+	
+	@tracer.setter
+	def tracer(self, value):
+		self._tracer = value
+
+	@property
+	def voice_catalog(self):
+		return self._voice_catalog
+	
+	@voice_catalog.setter
+	def voice_catalog(self, value):
+		self._voice_catalog = value
+
+	def prepare(self, concurrency):
+		# Called before a run with the number of requests that may run at once, services that
+		# keep connections open them here. Nothing to do for plain HTTP requests.
+		pass
+
+	def get_catalog_region(self):
+		# Services with a different voice list per region or endpoint include it here
+		return "global"
+
+	def list_voices(self):
+		return [self._normalize_voice(voice) for voice in self.get_voices() or []]
+
+	def get_catalog_voices(self):
+		if self._voice_catalog is not None:
+			return self._voice_catalog.get_voices(self)
+		return self.list_voices()
+
+	def get_output_formats(self):
+		# (format, sample_rate) pairs the service can deliver, format is one of "pcm", "wav" or "mp3"
+		return []
+
+	def negotiate_output_format(self):
+		# The output closest to the 32 kHz mono PCM of the sound packs
+		return audioprocessing.negotiate_output_format(self.get_output_formats())
+
+	def get_default_voice_settings(self, voice_id):
+		# Settings a voice starts with, only services with per voice defaults return a dict
+		return None
+
+	def validate_voice(self):
+		# Checks the selected voice against the voice list of the service
+		voice_id = self.get_voice_properties()[self.VOICE_PROPERTY]
+		if any(voice["id"] == voice_id for voice in self.get_catalog_voices()):
+			return True
+		if self._voice_catalog is None:
+			return False
+		# The voice may have been added since the catalog was saved, check the current list once
+		print(f"{self.SERVICE_NAME}: Voice {voice_id} not in the saved voice list, reloading it..")
+		voices = self._voice_catalog.refresh(self)["voices"]
+		return any(voice["id"] == voice_id for voice in voices)
+
+	def is_throttling_error(self, error):
+		if isinstance(error, ThrottlingError):
+			return True
+		message = str(error).lower()
+		return any(marker in message for marker in THROTTLING_MARKERS)
+
+	def is_retryable_error(self, error):
+		return self.is_throttling_error(error) or isinstance(error, (ConnectionError, TimeoutError))
+
+	def synthesize(self, text):
+		cache_key, cached_audio = self._get_cached_audio(text)
+		if cached_audio is not None:
+			return cached_audio
+		
+		audio_data, input_format = self._synthesize(text)
+		self._put_cached_audio(cache_key, audio_data, input_format)
+		return audio_data, input_format
+
+	async def synthesize_async(self, text):
+		cache_key, cached_audio = self._get_cached_audio(text)
+		if cached_audio is not None:
+			return cached_audio
+		
+		with span(self._tracer, "request", service=self.SERVICE_NAME, text=text):
+			audio_data, input_format = await self._run_request(lambda: self._synthesize_async(text), [text])
+		self._put_cached_audio(cache_key, audio_data, input_format)
+		return audio_data, input_format
+
+	async def _synthesize_async(self, text):
+		# Providers without an asyncio capable SDK run the blocking request in the loop's executor
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(None, self._synthesize, text)
+
+	async def _run_request(self, request, texts):
+		# The cost model only learns the time of the attempt that succeeded, waiting for the rate
+		# limiter, failed attempts and the backoff between them don't depend on the texts
+		async def timed_request():
+			start = time.perf_counter()
+			result = await request()
+			if self._cost_model is not None:
+				self._cost_model.add(self.SERVICE_NAME, texts, time.perf_counter() - start)
+			return result
+
+		if self._rate_limiter is not None:
+			return await self._rate_limiter.run(timed_request, self.is_throttling_error, self.is_retryable_error)
+		return await timed_request()
+
+	def can_batch(self, text):
+		# Phrases that are SSML documents themselves can't be combined with others
+		return self.SUPPORTS_BATCHING and self._batch_size > 1 and not text.startswith("<speak")
+
+	async def synthesize_batch_async(self, texts):
+		# Returns one (audio_data, input_format) per text. The phrases that aren't cached yet are
+		# synthesized in one request and split into clips, if the split fails they are requested one by one.
+		results = [None] * len(texts)
+		missing = []
+		for index, text in enumerate(texts):
+			cache_key, cached_audio = self._get_cached_audio(text)
+			if cached_audio is not None:
+				results[index] = cached_audio
+			else:
+				missing.append((index, text, cache_key))
+		if len(missing) == 0:
+			return results
+		
+		missing_texts = [text for _, text, _ in missing]
+		clips = None
+		if len(missing) > 1:
+			with span(self._tracer, "request", service=self.SERVICE_NAME, texts=missing_texts):
+				clips = await self._run_request(lambda: self._synthesize_batch_async(missing_texts), missing_texts)
+			if clips is None:
+				print(f"{self.SERVICE_NAME}: Splitting the batch of {len(missing)} phrases failed, synthesizing them one by one")
+		if clips is None:
+			with span(self._tracer, "request", service=self.SERVICE_NAME, texts=missing_texts):
+				clips = await asyncio.gather(*(self._run_request(lambda text=text: self._synthesize_async(text), [text]) for text in missing_texts))
+		
+		for (index, _, cache_key), (audio_data, input_format) in zip(missing, clips):
+			self._put_cached_audio(cache_key, audio_data, input_format)
+			results[index] = (audio_data, input_format)
+		return results
+
+	async def _synthesize_batch_async(self, texts):
+		# One clip per text or None, the phrases are found by the silence of the breaks between them
+		audio_data, input_format = await self._synthesize_async(self._get_batch_text(texts))
+		if audio_data is None:
+			return None
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(None, audioprocessing.split_batch, audio_data, input_format, len(texts), self.BATCH_BREAK)
+
+	def _get_batch_text(self, texts):
+		separator = f"""<break time="{int(self.BATCH_BREAK * 1000)}ms"/>"""
+		return f"<speak>{separator.join(escape(text) for text in texts)}</speak>"
+
+	def _get_cached_audio(self, text):
+		if self._cache is None:
+			return None, None
+		
+		with span(self._tracer, "cache", service=self.SERVICE_NAME, text=text):
+			cache_key = self._cache.get_key(self.SERVICE_NAME, self.get_voice_properties(), text)
+			cached_audio = self._cache.get(cache_key)
+		if cached_audio is not None:
+			print(f"{self.SERVICE_NAME}: Using cached audio for text [{text}]")
+		return cache_key, cached_audio
+
+	def is_cached(self, text):
+		# Only checks the index, the audio is read once it is needed
+		if self._cache is None:
+			return False
+		return self._cache.contains(self._cache.get_key(self.SERVICE_NAME, self.get_voice_properties(), text))
+
+	def _put_cached_audio(self, cache_key, audio_data, input_format):
+		if cache_key is not None and audio_data is not None:
+			self._cache.put(cache_key, audio_data, input_format)
+
+	def synthesize_stream(self, text):
+		# Returns (chunks, input_format), the chunks can be used while the service is still synthesizing
+		_, cached_audio = self._get_cached_audio(text)
+		if cached_audio is not None:
+			audio_data, input_format = cached_audio
+			return iter([audio_data]), input_format
+		return self._synthesize_stream(text)
+
+	def _synthesize_stream(self, text):
+		# Services without a streaming response deliver the whole clip as one chunk
+		audio_data, input_format = self._synthesize(text)
+		return iter([] if audio_data is None else [audio_data]), input_format
+
+	def play_text(self, text, is_cancelled=None, on_progress=None):
+		# Imported here, the command line builds don't need an audio device
+		from . import playback
+		
+		print(f"{self.SERVICE_NAME}: Playing Text..")
+		chunks, input_format = self.synthesize_stream(text)
+		return playback.play_stream(chunks, input_format, is_cancelled, on_progress)
+
+	def synthesize_preview(self, text):
+		# Decoded audio for playback: (frames x channels float samples, sample rate)
+		audio_data, input_format = self.synthesize(text)
+		if audio_data is None:
+			return None, None
+		return audioprocessing.decode_audio(audio_data, input_format)
+
 	def set_property_by_name(self, name, value):
 		if hasattr(self, name):
 			setattr(self, name, value)
 		else:
 			raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'", name=name, obj=self)
-	
-	@staticmethod
-	def save_and_convert_file(audio_data, input_format, file_path, apply_eq=False):
-		try:
-			tts_output = f"{TEMP_DIR}{os.sep}audio_file.{input_format}"
-
-			if not os.path.exists(os.path.dirname(tts_output)):
-				os.makedirs(os.path.dirname(tts_output))
-
-			with open(tts_output, "wb") as out:
-				out.write(audio_data)
-				print(f"Temporary audio content written to file {tts_output}")
-			if apply_eq:
-				# TODO: Take a look at https://github.com/jiaaro/pydub/blob/master/pydub/scipy_effects.py#L119
-				# 		scipy_effects does offer an eq function, maybe this could streamline this function a bit more
-				eq_file = f"{TEMP_DIR}{os.sep}eq.wav"
-				temp_file = AudioSegment.from_file(tts_output)
-				ffmpeg_parameters = [
-					"-ac", "1",
-					"-ar", "32000",
-					"-af", "equalizer=f=100:width_type=h:width=1800:g=-8,equalizer=f=10000:width_type=h:width=18000:g=7,silenceremove=start_periods=1:start_silence=0.075:start_threshold=-50dB,areverse,silenceremove=start_periods=1:start_silence=0.1:start_threshold=-50dB,areverse"
-				]
-				temp_file.export(eq_file, format="wav", parameters=ffmpeg_parameters)
-				temp_file = AudioSegment.from_file(eq_file)
-				temp_file.apply_gain(1).high_pass_filter(200).normalize(0.5).export(file_path, format="wav")
-			else:
-				temp_file = AudioSegment.from_file(tts_output)
-				ffmpeg_parameters = [
-					"-ac", "1",
-					"-ar", "32000",
-					"-af", "silenceremove=start_periods=1:start_silence=0.075:start_threshold=-50dB,areverse,silenceremove=start_periods=1:start_silence=0.1:start_threshold=-50dB,areverse"
-				]
-				temp_file.apply_gain(1).normalize(0.5).export(file_path, format="wav", parameters=ffmpeg_parameters)
-			
-		finally:
-			print(f"Audio file saved: {file_path}")
-			os.remove(tts_output)
-			if apply_eq:
-				os.remove(eq_file)
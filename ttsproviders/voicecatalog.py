@@ -0,0 +1,138 @@
+import json
+import os
+import re
+import threading
+import time
+
+from .atomicfile import write_json
+from .ttscache import CACHE_DIR
+
+CATALOG_DIR = f"{CACHE_DIR}{os.sep}voices"
+CATALOG_TTL = 7 * 24 * 60 * 60
+CATALOG_VERSION = 1
+
+
+# Local copy of the voice lists of the providers, one file per service and region. Each file
+# holds the normalized voices ({"id", "name", "language", "gender"}) and the default settings of
+# the voices that were looked up. Entries older than ttl seconds are still returned, but a
+# background thread fetches a fresh list for the next lookup. Only a missing entry blocks on
+# the network.
+class VoiceCatalog:
+	def __init__(self, directory=CATALOG_DIR, ttl=CATALOG_TTL):
+		self._directory = directory
+		self._ttl = ttl
+		self._lock = threading.Lock()
+		self._entries = {}
+		self._refreshing = set()
+
+		os.makedirs(self._directory, exist_ok=True)
+
+	@property
+	def directory(self):
+		return self._directory
+
+	@property
+	def ttl(self):
+		return self._ttl
+
+	def get_voices(self, tts_client):
+		entry = self._get_entry(tts_client)
+		if time.time() - entry["updated"] > self._ttl:
+			self._refresh_in_background(tts_client)
+		return entry["voices"]
+
+	def get_voice(self, tts_client, voice_id):
+		for voice in self.get_voices(tts_client):
+			if voice["id"] == voice_id:
+				return voice
+		return None
+
+	def get_voice_settings(self, tts_client, voice_id):
+		entry = self._get_entry(tts_client)
+		settings = entry["settings"].get(voice_id)
+		if settings is None:
+			settings = tts_client.get_default_voice_settings(voice_id)
+			if settings is None:
+				return None
+			with self._lock:
+				entry["settings"][voice_id] = settings
+				self._save(self._get_key(tts_client), entry)
+		return dict(settings)
+
+	def refresh(self, tts_client):
+		key = self._get_key(tts_client)
+		voices = tts_client.list_voices()
+		if not voices:
+			# Don't store a failed request as an empty voice list for the whole ttl
+			raise ValueError(f"{tts_client.SERVICE_NAME} returned no voices")
+		entry = {
+			"version": CATALOG_VERSION,
+			"updated": time.time(),
+			"voices": voices,
+			"settings": {}
+		}
+		with self._lock:
+			# Default settings rarely change, keep the ones already looked up
+			previous = self._entries.get(key)
+			if previous is not None:
+				entry["settings"] = previous["settings"]
+			self._entries[key] = entry
+			self._save(key, entry)
+		return entry
+
+	def _get_entry(self, tts_client):
+		key = self._get_key(tts_client)
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				entry = self._load(key)
+				if entry is not None:
+					self._entries[key] = entry
+		if entry is None:
+			print(f"{tts_client.SERVICE_NAME}: Loading voice list..")
+			entry = self.refresh(tts_client)
+		return entry
+
+	def _refresh_in_background(self, tts_client):
+		key = self._get_key(tts_client)
+		with self._lock:
+			if key in self._refreshing:
+				return
+			self._refreshing.add(key)
+
+		def refresh():
+			try:
+				self.refresh(tts_client)
+			except Exception as e:
+				print(f"{tts_client.SERVICE_NAME}: Refreshing the voice list failed: {e}")
+			finally:
+				with self._lock:
+					self._refreshing.discard(key)
+
+		threading.Thread(target=refresh, name="jasper-voice-catalog", daemon=True).start()
+
+	@staticmethod
+	def _get_key(tts_client):
+		key = f"{tts_client.SERVICE_NAME}_{tts_client.get_catalog_region()}".lower()
+		return re.sub(r"[^a-z0-9.-]+", "-", key)
+
+	def _get_file_path(self, key):
+		return f"{self._directory}{os.sep}{key}.json"
+
+	def _load(self, key):
+		try:
+			with open(self._get_file_path(key), "r", encoding="utf-8") as file:
+				entry = json.load(file)
+		except FileNotFoundError:
+			return None
+		except json.JSONDecodeError as error:
+			print(f"Ignoring unreadable voice catalog {self._get_file_path(key)}: {error}")
+			return None
+
+		if entry.get("version") != CATALOG_VERSION:
+			return None
+		return entry
+
+	def _save(self, key, entry):
+		# The GUI and a build may read the catalog at the same time
+		write_json(self._get_file_path(key), entry)